@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""benchmark
+Times the search over a fixed list of queries for all three games.
+
+Each query is run in a fresh process so its peak memory is its own.
+For every query this reports the wall time, the candidates looked at
+per second, the peak resident memory and the best set found, which is
+how results are checked to be as good as before. Runs can be saved as
+a baseline and later runs compared against it:
+
+    python3 benchmark.py --save
+    python3 benchmark.py --compare
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import core
+import engine
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'benchmark_baseline.json')
+# How much slower than the baseline a query can be before it is flagged,
+# as a fraction and in seconds, so tiny queries are not flagged for
+# noise.
+TOLERANCE = 0.25
+MIN_SLOWDOWN = 0.05
+# How many times each query is run, the fastest time is the one kept.
+REPEAT = 3
+# (game, skills, options) covering 1, 2, 3 and 5 skills, common and rare
+# trees and the gender, weapon and sort settings. The five skill MH3U
+# query has no sets, it times how fast the search gives up.
+QUERIES = [
+    ('MH4U', ['Attack Up (L)'], {}),
+    ('MH4U', ['Attack Up (L)', 'Weakness Exploit'], {}),
+    ('MH4U', ['Attack Up (L)', 'Weakness Exploit', 'Sharpness +1'],
+     {'sort_type': 'Defense'}),
+    ('MH4U', ['Attack Up (L)', 'Weakness Exploit', 'Sharpness +1'],
+     {'sort_type': 'Slots'}),
+    ('MH4U', ['Evasion +2', 'Guard +1', 'Earplugs'],
+     {'gender': 'Female', 'weapon': 'Blademaster'}),
+    ('MH4U', ['Load Up', 'Recovery Spd +1'],
+     {'weapon': 'Gunner', 'sort_type': 'Defense'}),
+    ('MH4U', ['Attack Up (M)', 'Weakness Exploit', 'Sharpness +1',
+              'Critical Eye +1'], {'sort_type': 'Defense'}),
+    ('MH4U', ['Evasion +1', 'Divine Blessing', 'Halve Stun', 'Fire Atk +1',
+              'Acrobat'], {}),
+    ('MH4U', ['Meat Lover', 'Use C.Range Coat', 'Attack Up (S)',
+              'Quick Sheath', 'Evasion +1'], {'sort_type': 'Slots'}),
+    ('MH3U', ['Focus'], {'sort_type': 'Slots'}),
+    ('MH3U', ['Evasion +1', 'Attack Up (S)'], {'sort_type': 'Defense'}),
+    ('MH3U', ['Razor Sharp', 'Weakness Exploit', 'Critical Eye +1'],
+     {'gender': 'Male'}),
+    ('MH3U', ['Reload Speed +1', 'Load Up', 'Recovery Spd +1'],
+     {'weapon': 'Gunner', 'sort_type': 'Slots'}),
+    ('MH3U', ['Attack Up (S)', 'Health +20', 'Guard +1', 'Earplugs',
+              'Constitution +1'], {'sort_type': 'Defense'}),
+    ('MHFU', ['Auto-Guard'], {}),
+    ('MHFU', ['Attack Up (Small)', 'Sharpness +1'],
+     {'sort_type': 'Defense'}),
+    ('MHFU', ['Carving Iron Man', 'Guard Inc', 'Earplug'],
+     {'sort_type': 'Slots'}),
+    ('MHFU', ['Reloading Speed +1', 'Load Up', 'Health +20'],
+     {'weapon': 'Gunner', 'gender': 'Female'}),
+    ('MHFU', ['Auto-Guard', 'Wide Area +1', 'Divine Protection',
+              'High Speed Gathering', 'Dragon Res +5'],
+     {'sort_type': 'Defense'}),
+    ('MHFU', ['Para Duration Halved', 'Fatigue Cancellation', 'Alchemy',
+              'Quick Eating', 'ESP'], {'gender': 'Male'}),
+]
+
+
+def query_name(query):
+    game, skills, options = query
+    settings = ['{}={}'.format(key, value) for key, value in
+                sorted(options.items())]
+    return ' '.join([game, ', '.join(skills)] + settings)
+
+
+def run_query(query, repeat=REPEAT):
+    """run_query
+    Runs one query `repeat` times and returns what was measured, with
+    the fastest time. Loading the game is not timed.
+    """
+    game, skills, options = query
+    data = core.load_game(game)
+    elapsed = None
+    for _ in range(repeat):
+        # The search fills in its own stats, even one that ends before
+        # it reports any progress.
+        stats = engine.SearchStats()
+        started = time.time()
+        sets = core.search(data, skills, stats=stats, **options)
+        taken = time.time() - started
+        elapsed = taken if elapsed is None else min(elapsed, taken)
+    best = None
+    if sets:
+        result = core.summary(data, sets[0])
+        best = [result['defense']['max'], result['slots'],
+                result['points']]
+    return {'seconds': round(elapsed, 4),
+            'candidates': stats.evaluated,
+            'rate': round(stats.evaluated / max(elapsed, 0.0001)),
+            # Linux gives the peak memory in kilobytes.
+            'peak_mb': round(resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'results': len(sets),
+            'best': best}
+
+
+def better(query, best, old):
+    """better
+    Compares the best sets of two runs by the sort type of the query.
+    Returns 1 if best is better, -1 if it is worse and 0 if they rank
+    the same.
+    """
+    if best == old:
+        return 0
+    if best is None or old is None:
+        return 1 if old is None else -1
+    order = engine.key_order(query[2].get('sort_type', 'Default'))
+    key = engine.set_key(order, *best)
+    old_key = engine.set_key(order, *old)
+    return (key > old_key) - (key < old_key)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the search.')
+    parser.add_argument('--save', action='store_true',
+                        help='save this run as the baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='flag queries that are slower or worse than '
+                        'the baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--game', help='only run the queries for a game')
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+                        help='runs of each query, the fastest is kept')
+    args = parser.parse_args(arguments)
+
+    baseline = {}
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    queries = [x for x in QUERIES if args.game in (None, x[0])]
+    run = {}
+    regressions = 0
+    print('{:>8} {:>12} {:>12} {:>8} {:>7}  {}'.format(
+        'seconds', 'candidates', 'per second', 'peak MB', 'results',
+        'query'))
+    for query in queries:
+        name = query_name(query)
+        # A new process for every query so the memory is not shared.
+        with multiprocessing.Pool(1) as pool:
+            measured = pool.apply(run_query, (query, args.repeat))
+        run[name] = measured
+        flags = []
+        old = baseline.get(name)
+        if old is not None:
+            if (measured['seconds'] > old['seconds'] * (1 + TOLERANCE) and
+                    measured['seconds'] - old['seconds'] > MIN_SLOWDOWN):
+                flags.append('SLOWER {:.2f}x'.format(
+                    measured['seconds'] / max(old['seconds'], 0.0001)))
+            if better(query, measured['best'], old['best']) < 0:
+                flags.append('WORSE {} < {}'.format(measured['best'],
+                                                    old['best']))
+        regressions += bool(flags)
+        print('{seconds:>8.3f} {candidates:>12,} {rate:>12,} {peak_mb:>8} '
+              '{results:>7}  '.format(**measured) + name +
+              ''.join('  ' + x for x in flags))
+    print('Total {:.3f} seconds.'.format(sum(x['seconds'] for x in
+                                              run.values())))
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent='\t', sort_keys=True)
+        print('Saved the baseline to {}.'.format(args.baseline))
+    if regressions:
+        print('{} queries regressed.'.format(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
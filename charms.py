@@ -0,0 +1,110 @@
+"""charms
+The talismans (charms) a player has, loaded from a file of their own.
+
+A charm has up to three slots and points in one or two skill trees. The
+file is either json, a list of {"slots": 2, "skills": {"Attack": 4}}
+with an optional "name", or csv in the form Athena's searcher exports,
+one charm a line as slots followed by tree and points pairs:
+
+    2,Attack,4,Expert,-2
+    # Lines starting with # are skipped.
+
+The search treats the charms as one more part, see engine.search_sets.
+"""
+
+
+import collections
+import csv
+import json
+import os
+
+import numpy
+
+
+class Charm(collections.namedtuple('Charm', ['name', 'slots', 'skills'])):
+    """Charm
+    One charm. skills is a tuple of (tree, points) pairs.
+    """
+    __slots__ = ()
+
+
+def charm_name(slots, skills):
+    """charm_name
+    The name a charm is shown with when the file does not give one, its
+    skills and slots like "Attack +4, Expert -2 oo-".
+    """
+    text = ', '.join('{} {:+}'.format(tree, points) for tree, points in
+                     skills)
+    return (text + ' ' + 'o' * slots + '-' * (3 - slots)).strip()
+
+
+def make_charm(slots, skills, name=None):
+    """make_charm
+    A Charm from its slots and a list of (tree, points), checking the
+    values. Raises ValueError if they are not numbers or there are too
+    many slots.
+    """
+    slots = int(slots)
+    if not 0 <= slots <= 3:
+        raise ValueError('A charm has 0 to 3 slots, not {}'.format(slots))
+    skills = tuple((str(tree).strip(), int(points)) for tree, points in
+                   skills if str(tree).strip())
+    return Charm(name or charm_name(slots, skills), slots, skills)
+
+
+def read_csv(lines):
+    """read_csv
+    The charms of the lines of a csv file. Raises ValueError for a line
+    with a tree and no points after it.
+    """
+    found = []
+    for number, row in enumerate(csv.reader(lines), 1):
+        if not row or not row[0].strip() or row[0].startswith('#'):
+            continue
+        # Some exports end the line with empty fields.
+        while not row[-1].strip():
+            row.pop()
+        if len(row) % 2 == 0:
+            raise ValueError('Line {}: {} has no points'.format(
+                             number, row[-1].strip()))
+        pairs = list(zip(row[1::2], row[2::2]))
+        found.append(make_charm(row[0], pairs))
+    return found
+
+
+def read_json(text):
+    """read_json
+    The charms of the text of a json file.
+    """
+    return [make_charm(item.get('slots', 0), item.get('skills', {}).items(),
+                       item.get('name')) for item in json.loads(text)]
+
+
+def load_charms(path):
+    """load_charms
+    The charms in a json or csv file, told apart by the extension.
+    Raises ValueError if the file is not in either form.
+    """
+    with open(path) as f:
+        text = f.read()
+    try:
+        if os.path.splitext(path)[1].lower() == '.json':
+            return read_json(text)
+        return read_csv(text.splitlines())
+    except (TypeError, AttributeError, json.JSONDecodeError) as error:
+        raise ValueError('Could not read the charms in {}: {}'.format(
+                         path, error))
+
+
+def charm_skills(data, charms):
+    """charm_skills
+    The points of the charms as an (n, trees) array in the columns of a
+    GameData. Raises ValueError for a tree the game does not have.
+    """
+    points = numpy.zeros((len(charms), len(data.trees)), dtype=numpy.int16)
+    for index, charm in enumerate(charms):
+        for tree, amount in charm.skills:
+            if tree not in data.tree_index:
+                raise ValueError('Unknown skill tree: {}'.format(tree))
+            points[index, data.tree_index[tree]] += amount
+    return points
@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""core
+The armour set search without the GUI.
+
+Loads the game data from the data folder and runs searches on it, so
+searches can be done from scripts or the command line without Gtk or a
+display. The GUI in searcher.py uses this too.
+
+    python3 core.py MH4U "Attack Up (L)" "Weakness Exploit" --limit 10
+"""
+
+
+import argparse
+import collections
+import json
+import os
+import sys
+
+import charms
+import decorations
+import engine
+import model
+import querycache
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# Where the compiled games are kept, one folder per game.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'cache')
+# Where the results of searches are kept, see querycache.
+QUERY_DIR = os.path.join(CACHE_DIR, 'queries')
+DATA_FILES = ['armour', 'jewels', 'skills']
+# The game the GUI last used, which searches default to.
+GAME_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'use_game.txt')
+# The games loaded so far, by name.
+loaded = {}
+# The genders and weapon types the pieces can be searched for.
+GENDERS = ['Both', 'Male', 'Female']
+WEAPONS = ['Both', 'Blademaster', 'Gunner']
+# The options a query of a batch file can have besides its skills.
+QUERY_KEYS = ['gender', 'weapon', 'rarity', 'limit', 'sort_type', 'hr',
+              'elder', 'weapon_slots', 'ties', 'prune', 'halves', 'avoid',
+              'min_defense', 'min_resistance', 'min_slots']
+queries = querycache.QueryCache(QUERY_DIR)
+
+
+def games():
+    """games
+    The names of the games in the data folder.
+    """
+    return sorted(os.listdir(DATA_DIR))
+
+
+def default_game():
+    """default_game
+    The game saved in use_game.txt, or the first one if there is none.
+    """
+    if os.path.exists(GAME_FILE):
+        with open(GAME_FILE) as f:
+            game = f.read().strip()
+        if game in games():
+            return game
+    return games()[0]
+
+
+def source_stamps(game):
+    """source_stamps
+    The modified time and size of each json file of a game, the cache of
+    the game is rebuilt when these change.
+    """
+    stamps = {}
+    for name in DATA_FILES:
+        info = os.stat(os.path.join(DATA_DIR, game, name + '.json'))
+        stamps[name] = (info.st_mtime_ns, info.st_size)
+    return stamps
+
+
+def load_game(game, use_cache=True):
+    """load_game
+    Loads the compiled GameData of a game. It comes from the cache folder
+    if the json has not changed since it was saved, otherwise the json
+    is read, compiled and saved to the cache. Each game is only loaded
+    once. The name of the game and the stamps of its json are kept on
+    the data as game and sources for the query cache.
+    """
+    if game in loaded:
+        return loaded[game]
+    folder = os.path.join(CACHE_DIR, game)
+    stamps = source_stamps(game)
+    data = model.load_cache(folder, stamps) if use_cache else None
+    if data is None:
+        files = []
+        for name in DATA_FILES:
+            with open(os.path.join(DATA_DIR, game, name + '.json')) as fp:
+                files.append(json.loads(fp.read()))
+        data = model.GameData(*files)
+        if use_cache:
+            try:
+                model.save_cache(data, folder, stamps)
+            except OSError as error:
+                print('Could not save the cache for {}: {}'.format(
+                      game, error), file=sys.stderr)
+    data.game = game
+    data.sources = stamps
+    loaded[game] = data
+    return data
+
+
+def rarity_parts(data, min_rarity=1, max_rarity=10, use_parts=None,
+                 hr=None, elder=None):
+    """rarity_parts
+    The names of the pieces for each part with a rarity in the range, in
+    the form search_sets takes use_parts, only the ones in use_parts if
+    it is given. hr and elder are the most hunter and elder rank the
+    pieces can need, MHFU only.
+    """
+    parts = {}
+    for part in engine.PARTS:
+        allowed = None if use_parts is None else set(use_parts[part])
+        ids = data.rarity_pieces(engine.PART_TITLES[part], min_rarity,
+                                 max_rarity, hr, elder)
+        parts[part] = [data.piece_names[i] for i in sorted(ids)
+                       if allowed is None or data.piece_names[i] in allowed]
+    return parts
+
+
+def check_skills(data, skills):
+    """check_skills
+    Raises ValueError for the first skill the game does not have.
+    """
+    for name in skills:
+        if name not in data.skills:
+            raise ValueError('Unknown skill: {}'.format(name))
+    return None
+
+
+def search_options(data, skills, gender='Both', weapon='Both',
+                   rarity=(1, 10), limit=100, sort_type='Default',
+                   use_parts=None, hr=None, elder=None, **options):
+    """search_options
+    Checks the arguments of search and turns them into the options of
+    engine.search_sets. Raises ValueError for a skill, charm or element
+    the game does not have, and for the other arguments the command line
+    would not take.
+    """
+    if gender not in GENDERS:
+        raise ValueError('Unknown gender: {}'.format(gender))
+    if weapon not in WEAPONS:
+        raise ValueError('Unknown weapon: {}'.format(weapon))
+    if sort_type not in engine.SORT_ORDERS:
+        raise ValueError('Unknown sort type: {}'.format(sort_type))
+    if not 0 <= options.get('weapon_slots', 0) <= decorations.MAX_SLOTS:
+        raise ValueError('A weapon has 0 to {} slots'.format(
+                         decorations.MAX_SLOTS))
+    if rarity[0] > rarity[1]:
+        raise ValueError('The min rarity is above the max rarity')
+    check_skills(data, skills)
+    check_skills(data, options.get('avoid', ()))
+    engine.resistance_floors(options.get('min_resistance'))
+    if options.get('inventory'):
+        charms.charm_skills(data, options['inventory'])
+    if tuple(rarity) != (1, 10) or hr is not None or elder is not None:
+        use_parts = rarity_parts(data, rarity[0], rarity[1], use_parts, hr,
+                                 elder)
+    options.update(gender=gender, weapon=weapon, sort_type=sort_type,
+                   limit=limit, use_parts=use_parts)
+    return options
+
+
+def search(game, skills, gender='Both', weapon='Both', rarity=(1, 10),
+           limit=100, sort_type='Default', use_parts=None, cache=None,
+           hr=None, elder=None, **options):
+    """search
+    Searches a game for the best `limit` sets with all the skills and
+    pieces with a rarity in the (min, max) range, needing at most the hr
+    and elder rank if they are given. game is the name of a
+    game or a GameData. Any other options are passed on to
+    engine.search_sets, avoid being the skills the sets must not have
+    and inventory the charms they can have. Returns the sets as
+    model.ArmourSets, see summary for a plainer form. cache is an
+    optional QueryCache the results are looked up in first and saved
+    to, queries is the one in the cache folder.
+    """
+    data = load_game(game) if isinstance(game, str) else game
+    options = search_options(data, skills, gender, weapon, rarity, limit,
+                             sort_type, use_parts, hr, elder, **options)
+    sets = None if cache is None else cache.lookup(skills, data, options)
+    if sets is None:
+        sets = engine.search_sets(list(skills), data, **options)
+        if cache is not None:
+            store_results(cache, skills, data, options, sets)
+    return sets
+
+
+def search_batch(game, queries, workers=1, cache=None):
+    """search_batch
+    Runs many searches of one game, see engine.search_batch. queries are
+    dicts of the arguments of search, skills being the wanted skills,
+    and are all checked before any is searched. With more than one
+    worker that many run at once. Yields (index, sets) for each query as
+    it is done, the ones in the cache first.
+    """
+    data = load_game(game) if isinstance(game, str) else game
+    found = []
+    for query in queries:
+        query = dict(query)
+        skills = list(query.pop('skills'))
+        found.append((skills, search_options(data, skills, **query)))
+    left = []
+    for index, (skills, options) in enumerate(found):
+        sets = None if cache is None else cache.lookup(skills, data, options)
+        if sets is None:
+            left.append(index)
+        else:
+            yield index, sets
+    for position, sets in engine.search_batch([found[i] for i in left],
+                                              data, workers):
+        index = left[position]
+        if cache is not None:
+            store_results(cache, found[index][0], data, found[index][1],
+                          sets)
+        yield index, sets
+
+
+def query_value_error(key, value):
+    """query_value_error
+    What is wrong with the value of a key of a batch file query, or None
+    if it is the type search takes for it.
+    """
+    def number(x):
+        return isinstance(x, int) and not isinstance(x, bool)
+
+    if key in ['skills', 'avoid', 'ties']:
+        if not isinstance(value, list) or not all(isinstance(x, str)
+                                                  for x in value):
+            return 'should be a list of strings'
+    elif key in ['gender', 'weapon', 'sort_type']:
+        if not isinstance(value, str):
+            return 'should be a string'
+    elif key in ['prune', 'halves']:
+        if not isinstance(value, bool):
+            return 'should be true or false'
+    elif key == 'rarity':
+        if not isinstance(value, list) or len(value) != 2 or not all(
+                map(number, value)):
+            return 'should be a list of the lowest and highest rarity'
+    elif key == 'min_resistance':
+        if not isinstance(value, dict) or not all(map(number,
+                                                      value.values())):
+            return 'should be an object of elements to numbers'
+    elif key in ['hr', 'elder']:
+        if value is not None and not number(value):
+            return 'should be a number or null'
+    elif not number(value):
+        return 'should be a number'
+    return None
+
+
+def read_queries(lines):
+    """read_queries
+    The queries of a batch file for search_batch, one json a line. A
+    line is either a list of skills or an object with "skills" and any
+    of QUERY_KEYS, like {"skills": ["Guard +1"], "sort_type": "Defense"}.
+    Blank lines and lines starting with # are skipped. Raises ValueError
+    for a line that is neither or has a value of the wrong type.
+    """
+    queries = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.startswith('#'):
+            continue
+        try:
+            query = json.loads(line)
+        except ValueError as error:
+            raise ValueError('Line {}: {}'.format(number, error))
+        if isinstance(query, list):
+            query = {'skills': query}
+        if not isinstance(query, dict) or not isinstance(
+                query.get('skills'), list):
+            raise ValueError('Line {}: not a list of skills or an object '
+                             'with "skills"'.format(number))
+        unknown = set(query) - set(QUERY_KEYS) - {'skills'}
+        if unknown:
+            raise ValueError('Line {}: unknown option {}'.format(
+                             number, ', '.join(sorted(unknown))))
+        for key in sorted(query):
+            error = query_value_error(key, query[key])
+            if error is not None:
+                raise ValueError('Line {}: "{}" {}'.format(number, key,
+                                                           error))
+        queries.append(query)
+    return queries
+
+
+def set_skills(game, pieces, weapon_slots=0, skills=(), avoid=(),
+               charm=None, inventory=None):
+    """set_skills
+    The skills a set of pieces can have along with the wanted skills as
+    (skill, model.ArmourSet) pairs, see engine.set_skills. pieces are
+    the names of the five pieces in engine.PARTS order and charm the
+    charms.Charm worn with them, if any. inventory is a list of charms
+    to try instead, no charm included, and each skill is given with the
+    most points any of them can have. Returns None if the pieces cannot
+    have all the wanted skills without the avoided ones.
+    """
+    data = load_game(game) if isinstance(game, str) else game
+    check_skills(data, skills)
+    check_skills(data, avoid)
+    if len(pieces) != len(engine.PARTS):
+        raise ValueError('A set needs {} pieces'.format(len(engine.PARTS)))
+    for name in pieces:
+        if name not in data.piece_index:
+            raise ValueError('Unknown piece: {}'.format(name))
+    worn = [charm] if inventory is None else [None] + list(inventory)
+    charms.charm_skills(data, [x for x in worn if x is not None])
+    ids = [data.piece_index[x] for x in pieces]
+    # The skill with the most points of each tree, from the first charm
+    # that can have it.
+    best = {}
+    possible = False
+    for item in worn:
+        found = engine.set_skills(data, ids, weapon_slots, list(skills),
+                                  list(avoid), item)
+        if found is None:
+            continue
+        possible = True
+        for name, armour_set in found:
+            tree = data.skills[name]['Jewel']
+            points = int(data.skills[name]['Points'])
+            if tree not in best or points > best[tree][0]:
+                best[tree] = (points, name, armour_set)
+    if not possible:
+        return None
+    return sorted([(name, armour_set) for _, name, armour_set in
+                   best.values()], key=lambda x: x[0])
+
+
+def store_results(cache, skills, data, options, sets):
+    """store_results
+    Saves the results of a search to a QueryCache, a cache that cannot
+    be written to is only reported.
+    """
+    try:
+        cache.store(skills, data, options, sets)
+    except OSError as error:
+        print('Could not save the results: {}'.format(error),
+              file=sys.stderr)
+    return None
+
+
+def summary(data, armour_set):
+    """summary
+    An ArmourSet as plain json friendly values: the pieces and jewels of each
+    part, the charm, defense, free slots, points past the wanted skills,
+    skill points, the skills that are active and resistances.
+    """
+    pieces, _ = data.armour_set_ids(armour_set)
+    defense = data.set_defense(pieces)
+    names, jewel_lists = data.armour_set_names(armour_set)
+    result = {
+        'pieces': dict(zip(engine.PARTS, names)),
+        'jewels': dict(zip(engine.PARTS + ['weapon', 'charm'], jewel_lists)),
+        'charm': None if armour_set.charm is None else armour_set.charm.name,
+        'defense': {'min': int(defense[0][0]), 'max': int(defense[1][0])},
+        'slots': data.armour_set_slots(armour_set),
+        'points': armour_set.points,
+        'skills': data.armour_set_points(armour_set),
+        'active': data.armour_set_skills(armour_set),
+        'resistance': dict(zip(model.RESISTANCES,
+                               data.set_resistance(pieces)[0].tolist())),
+    }
+    return result
+
+
+def collapse_sets(data, sets):
+    """collapse_sets
+    Groups the sets that are the same to a player, see
+    GameData.armour_set_signature. Returns the groups as lists of
+    indexes into sets, in the order of the first set of each, which is
+    the one shown with the others as its alternatives.
+    """
+    groups = collections.OrderedDict()
+    for index, armour_set in enumerate(sets):
+        groups.setdefault(data.armour_set_signature(armour_set),
+                          []).append(index)
+    return list(groups.values())
+
+
+def alternative(data, armour_set):
+    """alternative
+    The pieces, jewels and charm of a set, what summary gives for the
+    alternatives of a set as the rest is the same.
+    """
+    result = summary(data, armour_set)
+    return {key: result[key] for key in ['pieces', 'jewels', 'charm']}
+
+
+def result_rows(data, sets, every=False):
+    """result_rows
+    The summaries of sets as they are written out, each with the
+    alternatives of it under it, see collapse_sets, or every one on its
+    own with every.
+    """
+    if every:
+        return [summary(data, armour_set) for armour_set in sets]
+    return [dict(summary(data, sets[group[0]]), alternatives=[
+            alternative(data, sets[index]) for index in group[1:]])
+            for group in collapse_sets(data, sets)]
+
+
+def element_floor(text):
+    """element_floor
+    Reads an ELEMENT=POINTS argument into (element, points).
+    """
+    element, _, points = text.partition('=')
+    if element.capitalize() not in model.RESISTANCES:
+        raise argparse.ArgumentTypeError('unknown element: {}'.format(
+                                         element))
+    try:
+        return element.capitalize(), int(points)
+    except ValueError:
+        raise argparse.ArgumentTypeError('not a number: {}'.format(points))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Searches for the armour '
+                                     'sets with the given skills.')
+    parser.add_argument('game', help='one of ' + ', '.join(games()))
+    parser.add_argument('skills', nargs='*', help='the skills wanted')
+    parser.add_argument('--avoid', nargs='+', default=[], metavar='SKILL',
+                        help='skills the sets must not have, like negative '
+                        'skills')
+    parser.add_argument('--gender', default='Both',
+                        choices=GENDERS)
+    parser.add_argument('--weapon', default='Both',
+                        choices=WEAPONS)
+    parser.add_argument('--sort', default='Default',
+                        choices=sorted(engine.SORT_ORDERS))
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--min-rarity', type=int, default=1)
+    parser.add_argument('--max-rarity', type=int, default=10)
+    parser.add_argument('--max-hr', type=int,
+                        help='the highest hunter rank pieces can need, '
+                        'MHFU only')
+    parser.add_argument('--max-elder', type=int,
+                        help='the highest elder rank pieces can need, MHFU '
+                        'only')
+    parser.add_argument('--weapon-slots', type=int, default=0,
+                        choices=range(decorations.MAX_SLOTS + 1))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--min-defense', type=int, default=0,
+                        help='the least max defense of the sets')
+    parser.add_argument('--min-slots', type=int, default=0,
+                        help='the least free slots the sets have left')
+    parser.add_argument('--min-resistance', nargs='+', default=[],
+                        type=element_floor, metavar='ELEMENT=POINTS',
+                        help='the least resistance to elements, like '
+                        'Fire=5')
+    parser.add_argument('--charms', metavar='FILE',
+                        help='a json or csv file of the charms to use, see '
+                        'charms.py')
+    parser.add_argument('--halves', action='store_true',
+                        help='join upper and lower half sets, quicker '
+                        'with --no-prune')
+    parser.add_argument('--no-prune', action='store_true',
+                        help='keep the pieces other pieces beat, for more '
+                        'runners up')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='search again even if the query was cached')
+    parser.add_argument('--pieces', nargs=len(engine.PARTS),
+                        metavar=tuple(x.upper() for x in engine.PARTS),
+                        help='list the skills these pieces can also have '
+                        'instead of searching')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='run every query of a file, one json a line '
+                        'like ["Guard +1", "Earplugs"] or {"skills": '
+                        '["Guard +1"], "sort_type": "Defense"}, and write '
+                        'each result as a json line; --workers of them '
+                        'run at once')
+    parser.add_argument('--all', action='store_true',
+                        help='list every set instead of the alternatives '
+                        'of a set under it')
+    parser.add_argument('--format', default='json',
+                        choices=['json', 'jsonl'],
+                        help='one json list, or json lines with a set on '
+                        'each line')
+    args = parser.parse_args(arguments)
+
+    if not args.skills and args.pieces is None and args.batch is None:
+        parser.error('the skills are needed unless --pieces or --batch is '
+                     'given')
+
+    data = load_game(args.game)
+    inventory = None
+    if args.charms is not None:
+        try:
+            inventory = charms.load_charms(args.charms)
+        except (OSError, ValueError) as error:
+            print(error, file=sys.stderr)
+            return 1
+    # The options of the search, and of every query of a batch file
+    # that does not give its own.
+    defaults = dict(gender=args.gender, weapon=args.weapon,
+                    rarity=(args.min_rarity, args.max_rarity),
+                    limit=args.limit, sort_type=args.sort, hr=args.max_hr,
+                    elder=args.max_elder, weapon_slots=args.weapon_slots,
+                    prune=not args.no_prune, halves=args.halves,
+                    avoid=args.avoid, min_defense=args.min_defense,
+                    min_resistance=dict(args.min_resistance),
+                    min_slots=args.min_slots, inventory=inventory)
+    cache = None if args.no_cache else queries
+    if args.batch is not None:
+        try:
+            with open(args.batch) as f:
+                batch = [dict(defaults, **query) for query in
+                         read_queries(f)]
+            # Each result is written as soon as its search is done.
+            for index, sets in search_batch(data, batch, args.workers,
+                                            cache):
+                print(json.dumps({'query': index,
+                                  'skills': batch[index]['skills'],
+                                  'sets': result_rows(data, sets,
+                                                      args.all)}),
+                      flush=True)
+        except (OSError, ValueError) as error:
+            print(error, file=sys.stderr)
+            return 1
+        return 0
+    if args.pieces is not None:
+        try:
+            found = set_skills(data, args.pieces, args.weapon_slots,
+                               args.skills, args.avoid, inventory=inventory)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        if found is None:
+            print('These pieces cannot have all the skills.',
+                  file=sys.stderr)
+            return 1
+        results = [dict(skill=name, **summary(data, armour_set))
+                   for name, armour_set in found]
+    else:
+        try:
+            sets = search(data, args.skills, cache=cache,
+                          workers=args.workers, **defaults)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        results = result_rows(data, sets, args.all)
+    if args.format == 'jsonl':
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print(json.dumps(results, indent='\t'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""decorations
+Works out the jewels (decorations) for the slots of a set.
+
+Every way the useful jewels fit in a piece with 0 to 3 slots is worked
+out once per search, mixed sizes included. The solver then finds the
+fill that makes up a skill point deficit with the fewest slots for a
+set of pieces, the weapon counted as one more piece. Only how many
+pieces have 1, 2 and 3 slots matters for that, so the answers are kept
+in an LRU cache keyed on the deficit and that histogram.
+
+Torso Up pieces count the chest again, the jewels in it included. A
+chest counted more than once has slots of another kind, whose fills
+give the points that many times, see slot_kind.
+"""
+
+
+import functools
+import itertools
+import operator
+
+import numpy
+
+
+MAX_SLOTS = 3
+# Bigger than any amount of slots a set can have.
+INFINITE = 1000
+# How many (deficit, histogram) answers the solver keeps.
+CACHE_SIZE = 65536
+
+
+def slot_kind(slots, copies=1):
+    """slot_kind
+    The kind of the slots of a piece counted copies times, what the
+    solver is given instead of the slot count. It is the slot count for
+    pieces counted once, and 0 for no slots.
+    """
+    if slots == 0:
+        return 0
+    return slots + MAX_SLOTS * (copies - 1)
+
+
+def kind_slots(kind):
+    """kind_slots
+    The slot count of a slot kind.
+    """
+    return (kind - 1) % MAX_SLOTS + 1 if kind else 0
+
+
+def kind_capacity(kind):
+    """kind_capacity
+    How many plain slots the slots of a kind are worth, the slot count
+    times how many times the piece is counted.
+    """
+    return kind_slots(kind) * ((kind - 1) // MAX_SLOTS + 1) if kind else 0
+
+
+def kind_fills(fills, copies):
+    """kind_fills
+    The fills of jewel_fills for every slot kind up to pieces counted
+    copies times, indexed by the kind.
+    """
+    found = list(fills)
+    for times in range(2, copies + 1):
+        for slots in range(1, MAX_SLOTS + 1):
+            found.append([(tuple(times * x for x in vector), used, items)
+                          for vector, used, items in fills[slots]])
+    return found
+
+
+class Cancelled(Exception):
+    """Cancelled
+    Raised out of a search when the event it was given is set.
+    """
+
+
+def check_cancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise Cancelled()
+
+
+def jewel_fills(useful, size, cancelled=None):
+    """jewel_fills
+    Works out every way the useful jewels can be put into a piece with
+    0 to 3 slots. Returns a list indexed by the slot count, each item
+    being a list of (vector, used slots, jewels), fewest slots first.
+    cancelled is an optional threading.Event that is checked as it goes.
+    """
+    empty = tuple(0 for _ in range(size))
+    fills = []
+    for slots in range(MAX_SLOTS + 1):
+        best = {}
+        for count in range(slots + 1):
+            for combo in itertools.combinations_with_replacement(useful,
+                                                                 count):
+                check_cancelled(cancelled)
+                used = sum(x[1] for x in combo)
+                if used > slots:
+                    continue
+                vector = empty
+                for jewel in combo:
+                    vector = tuple(a + b for a, b in zip(vector, jewel[0]))
+                if vector not in best or used < best[vector][1]:
+                    best[vector] = (vector, used, [x[2] for x in combo])
+        # A fill that gives no more points for at least as many slots is
+        # never needed. The ones that could beat a fill come before it,
+        # and their points and slots are kept as arrays to check it with.
+        kept = []
+        kept_vectors = numpy.zeros((len(best), size), dtype=int)
+        kept_used = numpy.zeros(len(best), dtype=int)
+        for fill in sorted(best.values(), key=lambda x: (x[1], [-a for a in
+                                                                x[0]])):
+            check_cancelled(cancelled)
+            count = len(kept)
+            if not ((kept_used[:count] <= fill[1]) &
+                    (kept_vectors[:count] >= fill[0]).all(axis=1)).any():
+                kept_vectors[count] = fill[0]
+                kept_used[count] = fill[1]
+                kept.append(fill)
+        fills.append(kept)
+    return fills
+
+
+class JewelCosts:
+    """JewelCosts
+    A lower bound on the slots needed to make up a deficit with jewels.
+    For each tree it knows the fewest slots that give each amount of
+    points, ignoring the other trees and which piece the slots are on.
+    The trees are added up unless a jewel helps more than one of them,
+    then only the largest is used.
+    """
+
+    def __init__(self, useful, longest):
+        self.shared = any(sum(x > 0 for x in jewel[0]) > 1
+                          for jewel in useful)
+        self.tables = []
+        for i, length in enumerate(longest):
+            options = [(jewel[1], jewel[0][i]) for jewel in useful
+                       if jewel[0][i] > 0]
+            table = [0]
+            for points in range(1, length + 1):
+                table.append(min([slots + table[max(0, points - gain)]
+                                  for slots, gain in options] or
+                                 [INFINITE]))
+            self.tables.append(table)
+        self.arrays = [numpy.array(table) for table in self.tables]
+
+    def __call__(self, deficit):
+        costs = [0]
+        for table, points in zip(self.tables, deficit):
+            if points > 0:
+                costs.append(table[points] if points < len(table)
+                             else INFINITE)
+        return max(costs) if self.shared else sum(costs)
+
+    def batch(self, deficits):
+        """batch
+        The bound for every row of an (n, trees) array of deficits, none
+        of which can be longer than the tables.
+        """
+        costs = numpy.zeros(len(deficits), dtype=numpy.int32)
+        for i, table in enumerate(self.arrays):
+            points = numpy.maximum(deficits[:, i], 0)
+            if self.shared:
+                numpy.maximum(costs, table[points], out=costs)
+            else:
+                costs += table[points]
+        return costs
+
+
+def fill_bounds(fills, size):
+    """fill_bounds
+    The most and the least points of every tree any one fill of each
+    slot kind gives, as a list of (most, least) indexed by the kind.
+    """
+    return [(tuple(max(x[0][i] for x in options) for i in range(size)),
+             tuple(min(x[0][i] for x in options) for i in range(size)))
+            for options in fills]
+
+
+def fill_slots(slots, deficit, fills, slot_cost, counted=None,
+               bounds=None):
+    """fill_slots
+    Finds the jewels for pieces with the given slot kinds that make up
+    the deficit using the fewest slots. Returns (overshoot, used slots,
+    jewels per piece) or None if the deficit cannot be made up. Only
+    the first counted trees, all of them if it is None, count towards
+    the overshoot. bounds is fill_bounds of the fills, worked out here
+    if it is not given.
+    """
+    size = len(deficit)
+    if bounds is None:
+        bounds = fill_bounds(fills, size)
+    order = sorted(range(len(slots)), key=lambda i: -kind_capacity(slots[i]))
+    best_rem = [tuple(0 for _ in deficit)]
+    low_rem = [tuple(0 for _ in deficit)]
+    slot_rem = [0]
+    for index in reversed(order):
+        most, least = bounds[slots[index]]
+        slot_rem.insert(0, slot_rem[0] + kind_capacity(slots[index]))
+        best_rem.insert(0, tuple(map(operator.add, best_rem[0], most)))
+        low_rem.insert(0, tuple(map(operator.add, low_rem[0], least)))
+    # Once a tree has this many points the remaining jewels cannot take
+    # it back under, so anything above it is the same state.
+    caps = [tuple(deficit[i] - low[i] for i in range(size))
+            for low in low_rem]
+    memo = {}
+
+    def visit(depth, total):
+        total = tuple(min(a, b) for a, b in zip(total, caps[depth]))
+        key = (depth, total)
+        if key in memo:
+            return memo[key]
+        result = None
+        if (all(total[i] + best_rem[depth][i] >= deficit[i]
+                for i in range(size)) and
+                slot_cost([a - b for a, b in zip(deficit, total)])
+                <= slot_rem[depth]):
+            if depth == len(order):
+                result = (0, [])
+            else:
+                for vector, used, items in fills[slots[order[depth]]]:
+                    if result is not None and used >= result[0]:
+                        break
+                    rest = visit(depth + 1, tuple(a + b for a, b in
+                                                  zip(total, vector)))
+                    if rest is not None and (result is None or
+                                             used + rest[0] < result[0]):
+                        result = (used + rest[0], [(vector, items)] +
+                                  rest[1])
+        memo[key] = result
+        return result
+
+    found = visit(0, tuple(0 for _ in deficit))
+    if found is None:
+        return None
+    jewel_lists = [[] for _ in slots]
+    total = tuple(0 for _ in deficit)
+    for index, (vector, items) in zip(order, found[1]):
+        jewel_lists[index] = items
+        total = tuple(a + b for a, b in zip(total, vector))
+    return (sum(total[:counted]) - sum(deficit[:counted]), found[0],
+            jewel_lists)
+
+
+def histogram_layout(histogram):
+    """histogram_layout
+    The slot kinds of the pieces in a histogram, the highest first.
+    histogram[i] is how many pieces have slots of kind i + 1.
+    """
+    return tuple(kind for kind in range(len(histogram), 0, -1)
+                 for _ in range(histogram[kind - 1]))
+
+
+class Decorations:
+    """Decorations
+    The jewel solver for one search. useful is the list from
+    engine.useful_jewels and longest the most points any tree can need,
+    which is how long the tables of the slot cost bound are. counted is
+    how many of the trees, the first ones, count towards the overshoot,
+    all of them if it is None. copies is the most times the chest can be
+    counted, see slot_kind.
+    """
+
+    def __init__(self, useful, longest, counted=None, copies=1,
+                 cache_size=CACHE_SIZE):
+        self.counted = counted
+        self.kinds = MAX_SLOTS * copies
+        self.fills = kind_fills(jewel_fills(useful, len(longest)), copies)
+        self.bounds = fill_bounds(self.fills, len(longest))
+        self.slot_cost = JewelCosts(useful, longest)
+        self.solve = functools.lru_cache(cache_size)(self.fit)
+
+    def fit(self, deficit, histogram):
+        """fit
+        The uncached solver, use solve. Returns (overshoot, used slots,
+        jewels per piece) for the pieces of the histogram, in the order
+        of histogram_layout, or None if the deficit cannot be made up.
+        """
+        return fill_slots(histogram_layout(histogram), deficit, self.fills,
+                          self.slot_cost, self.counted, self.bounds)
+
+    def solve_layout(self, deficit, slots):
+        """solve_layout
+        solve for pieces with the given slot kinds. Returns (overshoot,
+        used slots, jewels per piece) with a tuple of jewels for each
+        piece in the order of slots, or None.
+        """
+        filled = self.solve(tuple(deficit), self.histogram(list(slots)))
+        if filled is None:
+            return None
+        order = sorted((i for i in range(len(slots)) if slots[i]),
+                       key=lambda i: -slots[i])
+        jewel_lists = [()] * len(slots)
+        for index, items in zip(order, filled[2]):
+            jewel_lists[index] = tuple(items)
+        return filled[0], filled[1], tuple(jewel_lists)
+
+    def histogram(self, slots):
+        """histogram
+        The histogram of a list of slot kinds.
+        """
+        return tuple(slots.count(kind) for kind in range(1, self.kinds + 1))
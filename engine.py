@@ -0,0 +1,1432 @@
+"""engine
+The search engine for the armour set searcher.
+
+Instead of walking every head, chest, arms, waist and legs combination
+like an odometer this does a depth first branch and bound search.
+For each wanted skill it knows the most points the unchosen parts (and
+the jewels that fit in their slots) can still give, so any partial set
+that cannot reach the skill thresholds is dropped straight away. Partial
+sets that cannot beat the worst of the current top results are dropped
+as well, which means the results are the exact best sets and there is
+no need for a size limit. The last two parts are scored together, all
+their pairs in one go with the arrays of the compiled game data.
+
+Torso Up pieces count the chest again, so the chest is searched once
+for each number of times it can be counted, with its points and jewels
+that many times. Two more columns after the trees make sure the set has
+that many Torso Up pieces, which have no points of their own, so the
+bounds work for them like they do for the trees.
+
+The search can be split over several processes, each one taking a share
+of the head pieces and keeping its own top results, which are merged at
+the end. Many searches can also be run at once, one to a process, see
+search_batch. While it runs the best sets so far and how far it has got can
+be reported a few times a second.
+"""
+
+
+import collections
+import functools
+import heapq
+import itertools
+import math
+import multiprocessing
+import operator
+import sys
+import threading
+import time
+
+import numpy
+
+import charms
+import decorations
+import model
+
+
+PARTS = ['head', 'chest', 'arms', 'waist', 'legs']
+PART_TITLES = {'head': 'Head', 'chest': 'Chest', 'arms': 'Arms',
+               'waist': 'Waist', 'legs': 'Legs'}
+# The values set_key ranks by and the ones each sort type uses first.
+KEY_VALUES = ['defense', 'slots', 'points']
+SORT_ORDERS = {'Slots': ['slots', 'defense'],
+               'Defense': ['defense', 'slots'],
+               'Default': ['points']}
+# The least seconds between two progress reports.
+PROGRESS_INTERVAL = 0.25
+# How often in seconds a search split over workers checks if it has been
+# cancelled while it waits for them.
+CANCEL_POLL = 0.05
+# How many shares of the head pieces each worker process gets, so one
+# slow share does not leave the other workers idle.
+SHARES_PER_WORKER = 4
+# How many upper halves are joined with all the lower halves at once.
+HALF_BLOCK = 256
+# How many sets of trees a SearchSession keeps the beating pairs of.
+SESSION_SIZE = 16
+
+
+def wanted_trees(wanted_skills, skills, avoid=()):
+    """wanted_trees
+    Turns a list of skill names into a list of (tree, sign, points).
+    The sign is -1 for negative skills so every tree can be treated as
+    "get at least this many points". avoid are skills that must not be
+    active, usually negative ones, and each one is a tree that has to
+    stay short of its points. These come after the wanted trees with
+    points of 0 or less, and are left out if a wanted skill already
+    keeps them off. Returns None if the skills can never all be active
+    with none of the avoided ones.
+    """
+    trees = {}
+    for name in wanted_skills:
+        points = int(skills[name]['Points'])
+        key = (skills[name]['Jewel'], 1 if points > 0 else -1)
+        trees[key] = max(trees.get(key, 0), abs(points))
+    limits = {}
+    for name in avoid:
+        points = int(skills[name]['Points'])
+        key = (skills[name]['Jewel'], -1 if points > 0 else 1)
+        if key not in trees:
+            limits[key] = max(limits.get(key, 1 - abs(points)),
+                              1 - abs(points))
+    found = list(trees.items()) + list(limits.items())
+    # A tree has to be at least points and at most minus the points of
+    # its other sign.
+    needs = dict(found)
+    for (tree, sign), points in found:
+        if points + needs.get((tree, -sign), -points) > 0:
+            return None
+    return [(tree, sign, points) for (tree, sign), points in found]
+
+
+def search_trees(wanted_skills, data, avoid=(), inventory=None):
+    """search_trees
+    wanted_trees without the avoided trees no set can ever reach the
+    limit of. For every such tree it takes the fewest points any piece
+    of each part gives, and the fewest per slot of the jewels the search
+    could use filling every slot a set can have. The jewels are the ones
+    that help a tree that is kept, so the trees are added until no more
+    can be reached. inventory is the list of charms.Charm the sets can
+    have one of, if any.
+    """
+    trees = wanted_trees(wanted_skills, data.skills, avoid)
+    if not trees:
+        return trees
+    kept = [x for x in trees if x[2] > 0]
+    limits = [x for x in trees if x[2] <= 0]
+    worst = tree_vectors(data, data.piece_skills, limits)
+    # The chest and its jewels can be counted up to copies times.
+    copies = most_copies(data, model.PARTS)
+    armour = sum(worst[data.part_pieces(part)].min(axis=0, initial=0) *
+                 (copies if part == 'Chest' else 1) for part in model.PARTS)
+    most_slots = decorations.MAX_SLOTS * (len(model.PARTS) + copies)
+    if inventory:
+        armour = armour + tree_vectors(data, charms.charm_skills(
+            data, inventory), limits).min(axis=0, initial=0)
+        most_slots += decorations.MAX_SLOTS
+    while limits:
+        indexes = [x[2] for x in useful_jewels(data, kept)]
+        vectors = tree_vectors(data, data.jewel_skills[indexes], limits)
+        per_slot = vectors / numpy.maximum(
+            data.jewel_slots[indexes], 1)[:, None]
+        lowest = armour + most_slots * numpy.minimum(
+            per_slot.min(axis=0, initial=0), 0)
+        reached = [i for i, x in enumerate(limits) if lowest[i] < x[2]]
+        if not reached:
+            break
+        kept += [limits[i] for i in reached]
+        left = [i for i in range(len(limits)) if i not in reached]
+        limits = [limits[i] for i in left]
+        armour = armour[left]
+    # The wanted trees stay first as the solver counts the points of the
+    # first ones.
+    return [x for x in trees if x in kept]
+
+
+def most_copies(data, parts):
+    """most_copies
+    The most times the chest can be counted, once and once more for
+    each of the other parts that has a Torso Up piece. parts are the
+    piece ids of each part, or the part names for all of them.
+    """
+    return 1 + sum(bool(data.torso_up[data.part_pieces(pieces) if
+                                      isinstance(pieces, str) else
+                                      pieces].any()) for pieces in parts)
+
+
+def torso_columns(data, pieces):
+    """torso_columns
+    The two columns the search counts the Torso Up pieces of a set in,
+    1 and -1 for the Torso Up pieces of an array of piece ids and 0 for
+    the others. As more columns for dominated, only Torso Up pieces can
+    beat each other.
+    """
+    torso = data.torso_up[pieces].astype(int)
+    return numpy.stack([torso, -torso], axis=1)
+
+
+def tree_vectors(data, matrix, trees):
+    """tree_vectors
+    The signed points each row of a pieces or jewels matrix gives
+    towards the wanted trees.
+    """
+    columns = [data.tree_index[tree] for tree, _, _ in trees]
+    signs = numpy.array([sign for _, sign, _ in trees], dtype=numpy.int32)
+    return matrix[:, columns] * signs
+
+
+def piece_fits(item, gender, weapon):
+    """piece_fits
+    Checks the piece can be worn with the chosen gender and weapon.
+    MH3U calls pieces that suit every weapon 'All' instead of 'Both'.
+    """
+    return ((weapon == 'Both' or item['type'] in (weapon, 'Both', 'All'))
+            and (gender == 'Both' or item['gender'] in (gender, 'Both')))
+
+
+def usable_pieces(data, part, gender, weapon, use_parts=None):
+    """usable_pieces
+    The ids of the pieces for a part that can be worn with the gender and
+    weapon, only the ones in use_parts if it is given. Torso Up pieces
+    are in it too.
+    """
+    allowed = None if use_parts is None else set(use_parts[part])
+    usable = []
+    for index in data.part_pieces(PART_TITLES[part]):
+        name = data.piece_names[index]
+        item = data.armour[name]
+        if ((allowed is None or name in allowed) and
+                piece_fits(item, gender, weapon)):
+            usable.append(int(index))
+    return usable
+
+
+def resistance_floors(min_resistance):
+    """resistance_floors
+    The columns of model.RESISTANCES that have a minimum and the
+    minimums, for a dict of element to the least resistance wanted.
+    Raises ValueError for an element that is not one of them.
+    """
+    elements = []
+    floors = []
+    for element, floor in sorted((min_resistance or {}).items()):
+        if element.capitalize() not in model.RESISTANCES:
+            raise ValueError('Unknown element: {}'.format(element))
+        elements.append(model.RESISTANCES.index(element.capitalize()))
+        floors.append(int(floor))
+    return elements, tuple(floors)
+
+
+def charm_pieces(data, inventory, trees, fills):
+    """charm_pieces
+    The charms worth wearing for the wanted trees as (vector, slots,
+    index into inventory), None for the index of wearing no charm. The
+    charms another one beats are dropped, see dominated.
+    """
+    vectors = numpy.vstack([numpy.zeros((1, len(trees)), dtype=int),
+                            tree_vectors(data, charms.charm_skills(
+                                data, inventory), trees)])
+    slots = numpy.array([0] + [x.slots for x in inventory])
+    mask, _ = dominated(vectors, slots, numpy.zeros(len(slots), dtype=int),
+                        fills)
+    return [(tuple(vectors[i].tolist()), int(slots[i]),
+             None if i == 0 else int(i) - 1)
+            for i in numpy.flatnonzero(~mask)]
+
+
+def useful_jewels(data, trees):
+    """useful_jewels
+    The jewels that give points to at least one wanted tree, as a list
+    of (vector, slots, jewel id).
+    """
+    indexes = data.tree_jewels([tree for tree, _, _ in trees])
+    vectors = tree_vectors(data, data.jewel_skills[indexes], trees)
+    useful = []
+    for index, vector in zip(indexes, vectors.tolist()):
+        if max(vector) > 0:
+            useful.append((tuple(vector), int(data.jewel_slots[index]),
+                           index))
+    return useful
+
+
+def beat_pairs(slots, defense, extra=None):
+    """beat_pairs
+    The pairs of pieces of one part where the first has at least the
+    slots and defense of the second, and at least the extra columns if
+    they are given, as two arrays of indexes. Only these can beat each
+    other whatever skills are wanted.
+    """
+    beats = ((slots[:, None] >= slots[None, :]) &
+             (defense[:, None] >= defense[None, :]))
+    if extra is not None:
+        beats &= (extra[:, None, :] >= extra[None, :, :]).all(axis=2)
+    return numpy.nonzero(beats)
+
+
+def dominated(vectors, slots, defense, fills, extra=None, pairs=None,
+              cancelled=None):
+    """dominated
+    A mask of the pieces that another piece of the same part beats. A
+    piece beats another if it has at least as much defense and, after
+    putting jewels in the slots it has over the other one, at least as
+    many points in every wanted tree. Any set using the beaten piece is
+    then no better than the same set with the other one. extra is an
+    optional array of more columns that have to be at least as big, like
+    the resistances. Pieces that are the same in everything are kept.
+
+    pairs are the pairs to check, beat_pairs if they are not given.
+    Returns the mask and the pairs where the first piece beats the
+    second. Wanting more trees only takes pairs away, so these can be
+    given back for a search with the same trees and more. cancelled is
+    checked as for search_sets.
+    """
+    if pairs is None:
+        pairs = beat_pairs(slots, defense, extra)
+    first, second = pairs
+    # The pairs where the first piece is short of points need a fill in
+    # the spare slots.
+    short = numpy.maximum(vectors[second] - vectors[first], 0)
+    spare = slots[first].astype(int) - slots[second]
+    covered = ~short.any(axis=1)
+    for vector, used, _ in fills[decorations.MAX_SLOTS]:
+        check_cancelled(cancelled)
+        left = numpy.flatnonzero(~covered & (spare >= used))
+        covered[left] = (short[left] <= vector).all(axis=1)
+    first, second = first[covered], second[covered]
+    beats = numpy.zeros((len(vectors), len(vectors)), dtype=bool)
+    beats[first, second] = True
+    return (beats & ~beats.T).any(axis=0), (first, second)
+
+
+def prune_pieces(wanted_skills, data, gender='Both', weapon='Both',
+                 use_parts=None, resistances=(), avoid=(),
+                 inventory=None, cancelled=None):
+    """prune_pieces
+    Drops the pieces another piece of the same part beats for these
+    wanted skills, see dominated. Returns the names of the pieces left
+    for every part, in the form use_parts is given in, and how many were
+    dropped. resistances are the columns of model.RESISTANCES that have
+    a minimum, a piece also needs at least as much of those to beat
+    another. Torso Up pieces only beat each other.
+    avoid are skills the sets must not have and inventory the charms
+    they can have, see search_trees. cancelled is checked as for
+    search_sets.
+    """
+    trees = search_trees(wanted_skills, data, avoid, inventory)
+    if not trees:
+        return use_parts, 0
+    fills = decorations.jewel_fills(useful_jewels(data, trees),
+                                    len(trees), cancelled)
+    vectors = tree_vectors(data, data.piece_skills, trees)
+    kept = {}
+    removed = 0
+    for part in PARTS:
+        check_cancelled(cancelled)
+        pieces = numpy.array(usable_pieces(data, part, gender, weapon,
+                                           use_parts), dtype=int)
+        extra = torso_columns(data, pieces)
+        if resistances:
+            extra = numpy.hstack([extra, data.resistance[pieces][
+                :, list(resistances)]])
+        mask, _ = dominated(vectors[pieces], data.piece_slots[pieces],
+                            data.defense_max[pieces], fills, extra,
+                            cancelled=cancelled)
+        kept[part] = [data.piece_names[i] for i in pieces[~mask]]
+        removed += int(mask.sum())
+    return kept, removed
+
+
+def set_skills(data, pieces, weapon_slots=0, wanted_skills=(), avoid=(),
+               charm=None):
+    """set_skills
+    What jewels can add to a set of five pieces, given as piece ids in
+    PARTS order, on top of the wanted skills. For every tree it finds
+    the skill with the most points that can be active along with all
+    the wanted skills. Returns a list of (skill, ArmourSet) by skill
+    name, the set having the jewels that do it, or None if the wanted
+    skills cannot all be active. None of the avoid skills are active in
+    any of the sets. charm is the charms.Charm the set has, if any.
+    """
+    layout = [int(data.piece_slots[i]) for i in pieces] + [weapon_slots]
+    worn = [] if charm is None else [charm]
+    if charm is not None:
+        layout.append(charm.slots)
+    copies = 1 + int(data.torso_up[list(pieces)].sum())
+    layout[model.CHEST] = decorations.slot_kind(layout[model.CHEST], copies)
+
+    def fill(trees):
+        need = [points for _, _, points in trees]
+        vectors = tree_vectors(data, data.piece_skills[list(pieces)], trees)
+        vector = vectors.sum(axis=0) + (copies - 1) * vectors[model.CHEST]
+        if worn:
+            vector += tree_vectors(data, charms.charm_skills(data, worn),
+                                   trees)[0]
+        vector = vector.tolist()
+        deficit = [a - b for a, b in zip(need, vector)]
+        useful = useful_jewels(data, trees)
+        longest = [max(0, x) for x in deficit]
+        # The fewest slots for each tree on its own is a quick check
+        # before all the trees are fitted together.
+        if decorations.JewelCosts(useful, longest)(deficit) > sum(
+                map(decorations.kind_capacity, layout)):
+            return None
+        counted = sum(points > 0 for points in need)
+        filled = decorations.Decorations(useful, longest, counted,
+                                         copies).solve_layout(deficit,
+                                                              layout)
+        if filled is None:
+            return None
+        return model.ArmourSet(tuple(pieces), filled[2], weapon_slots,
+                               -filled[0], charm)
+
+    trees = search_trees(wanted_skills, data, avoid, worn)
+    if trees is None or trees and fill(trees) is None:
+        return None
+    found = []
+    for tiers in data.tree_skills.values():
+        for points, name in reversed(tiers):
+            if points < 0:
+                break
+            trees = search_trees(list(wanted_skills) + [name], data, avoid,
+                                 worn)
+            if trees is None:
+                continue
+            armour_set = fill(trees)
+            if armour_set is not None:
+                found.append((name, armour_set))
+                break
+    return sorted(found, key=lambda x: x[0])
+
+
+def beats(worst, columns, count):
+    """beats
+    Compares the keys of count sets, given as one array per item of the
+    key, with the worst kept key. Returns a mask of the ones that are
+    better.
+    """
+    better = numpy.zeros(count, dtype=bool)
+    equal = ~better
+    for value, column in zip(worst, columns):
+        better |= equal & (column > value)
+        equal &= column == value
+    return better
+
+
+def key_order(sort_type, ties=()):
+    """key_order
+    What sets are ranked by for a sort type, as indexes into the values
+    of set_key, followed by the ties which are more of 'defense',
+    'slots' and 'points'. 'Default' ranks by the points alone, the sets
+    that go least past the wanted points first, and keeps the order the
+    rest are found in, which tries the most wanted points first.
+    """
+    order = list(SORT_ORDERS.get(sort_type, []))
+    order += [name for name in ties if name not in order]
+    return tuple(KEY_VALUES.index(name) for name in order)
+
+
+def set_key(order, defense, free_slots, points=0):
+    """set_key
+    The value sets are ranked by, bigger is better. points is minus how
+    far the set goes past the wanted points, so never more than 0.
+    """
+    values = (defense, free_slots, points)
+    return tuple([values[i] for i in order])
+
+
+class TopK:
+    """TopK
+    Keeps the best `size` items pushed to it on a heap, so only that
+    many are ever held however many are pushed. Items with the same key
+    are kept in the order they were pushed. snapshot can be called at
+    any time for the best items so far.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.heap = []
+        self.counter = itertools.count()
+        # Goes up every time the kept items change.
+        self.version = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def full(self):
+        return len(self.heap) >= self.size
+
+    def worst(self):
+        """worst
+        The key of the worst item kept.
+        """
+        return self.heap[0][0]
+
+    def rejects(self, key):
+        """rejects
+        Checks if an item with this key would be thrown away.
+        """
+        return self.size <= 0 or self.full() and self.heap[0][0] >= key
+
+    def push(self, key, item):
+        """push
+        Adds an item if it is one of the best so far. Returns True if it
+        was kept.
+        """
+        if self.rejects(key):
+            return False
+        entry = (key, -next(self.counter), item)
+        if self.full():
+            heapq.heapreplace(self.heap, entry)
+        else:
+            heapq.heappush(self.heap, entry)
+        self.version += 1
+        return True
+
+    def snapshot(self):
+        """snapshot
+        The items kept so far as (key, -pushed, item), best first.
+        """
+        return sorted(self.heap, reverse=True)
+
+    def items(self):
+        """items
+        The items kept so far, best first.
+        """
+        return [entry[2] for entry in self.snapshot()]
+
+
+class SearchStats:
+    """SearchStats
+    How far a search has got. evaluated is how many partial sets and
+    pairs of the last two parts were looked at, pruned how many of those
+    were dropped without being searched any further and removed how many
+    pieces prune_pieces dropped before the search. cached is True if the
+    results came from a query cache and there was no search.
+    """
+
+    def __init__(self):
+        self.evaluated = 0
+        self.pruned = 0
+        self.removed = 0
+        self.cached = False
+        self.started = time.time()
+
+    def add(self, other):
+        self.evaluated += other.evaluated
+        self.pruned += other.pruned
+
+    def text(self):
+        """text
+        A line about the progress for showing to the user.
+        """
+        if self.cached:
+            return 'Found in the query cache'
+        elapsed = max(time.time() - self.started, 0.001)
+        percent = 100 * self.pruned / max(self.evaluated, 1)
+        return ('{:,} candidates, {:.1f}% pruned, {:,.0f} per second, {:,} '
+                'pieces dropped'.format(self.evaluated, percent,
+                                        self.evaluated / elapsed,
+                                        self.removed))
+
+
+# The jewel fills are worked out with the same checks, so they live in
+# decorations.
+Cancelled = decorations.Cancelled
+check_cancelled = decorations.check_cancelled
+
+
+class Buckets:
+    """Buckets
+    The halves of every bucket of half_sets, as rows of group indexes
+    with their defense, best first. They are only sliced out of the
+    table when a bucket is asked for.
+    """
+
+    def __init__(self, index, defense, starts):
+        self.index = index
+        self.defense = defense
+        self.starts = starts
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, bucket):
+        start, end = self.starts[bucket], self.starts[bucket + 1]
+        return self.index[start:end], self.defense[start:end]
+
+
+def unique_rows(rows, cancelled=None):
+    """unique_rows
+    numpy.unique of the rows of a 2d int array with the first index and
+    inverse of each. The rows are packed into one number each when they
+    fit, which is much faster than comparing them as rows. cancelled is
+    checked as for search_sets.
+    """
+    if not len(rows):
+        return rows, numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    low = rows.min(axis=0)
+    span = [int(x) for x in rows.max(axis=0) - low + 1]
+    check_cancelled(cancelled)
+    if math.prod(span) >= 2 ** 62:
+        keys, first, inverse = numpy.unique(rows, axis=0, return_index=True,
+                                            return_inverse=True)
+        return keys, first, inverse.reshape(-1)
+    scale = numpy.cumprod([1] + span[:0:-1], dtype=numpy.int64)[::-1]
+    packed = (rows - low) @ scale
+    check_cancelled(cancelled)
+    _, first, inverse = numpy.unique(packed, return_index=True,
+                                     return_inverse=True)
+    return rows[first], first, inverse.reshape(-1)
+
+
+def half_sets(parts, size, kinds=decorations.MAX_SLOTS, cancelled=None):
+    """half_sets
+    Every way of choosing one group from each of parts, the candidate
+    groups of some of the parts as search_entries makes them, bucketed
+    by their points and how many pieces have each of the slot kinds up
+    to kinds, see decorations.slot_kind. The halves in a bucket are the
+    same to any other half, only their defense is different. Returns the
+    points, optimistic points, slot histogram, slots counted and best
+    defense of every bucket as arrays, and the Buckets of their halves.
+    cancelled is checked as for search_sets.
+    """
+    shape = [len(x) for x in parts]
+    index = numpy.indices(shape).reshape(len(parts), -1).T
+    vectors = numpy.zeros(shape + [size], dtype=int)
+    optimistic = numpy.zeros(shape + [size], dtype=int)
+    defense = numpy.zeros(shape, dtype=int)
+    histogram = numpy.zeros(shape + [kinds], dtype=int)
+    for column, groups in enumerate(parts):
+        check_cancelled(cancelled)
+        # Each part's values are spread along its own axis of the table.
+        axis = [1] * len(parts)
+        axis[column] = -1
+        vectors += numpy.array([x[1] for x in groups]).reshape(axis + [size])
+        optimistic += numpy.array([x[3] for x in groups]).reshape(
+            axis + [size])
+        defense += numpy.array([x[4] for x in groups]).reshape(axis)
+        slots = numpy.array([x[6] for x in groups])
+        histogram += (slots[:, None] == numpy.arange(1, kinds + 1)).reshape(
+            axis + [kinds])
+    check_cancelled(cancelled)
+    vectors = vectors.reshape(-1, size)
+    optimistic = optimistic.reshape(-1, size)
+    defense = defense.reshape(-1)
+    histogram = histogram.reshape(-1, kinds)
+    keys, first, bucket = unique_rows(numpy.hstack([vectors, histogram]),
+                                      cancelled)
+    check_cancelled(cancelled)
+    rank = numpy.lexsort((-defense, bucket))
+    starts = numpy.searchsorted(bucket[rank], numpy.arange(len(keys) + 1))
+    histogram = keys[:, size:]
+    capacity = [decorations.kind_capacity(x) for x in range(1, kinds + 1)]
+    return (keys[:, :size], optimistic[first], histogram,
+            histogram @ numpy.array(capacity, dtype=int),
+            defense[rank[starts[:-1]]],
+            Buckets(index[rank], defense[rank], starts))
+
+
+def search_entries(wanted_skills, data, gender='Both', weapon='Both',
+                   sort_type='Default', limit=100, use_parts=None,
+                   weapon_slots=0, ties=(), share=None, stats=None,
+                   progress=None, cancelled=None, halves=False, avoid=(),
+                   inventory=None, min_defense=0, min_resistance=None,
+                   min_slots=0):
+    """search_entries
+    Does the search for search_sets and returns the top results as a
+    list of (key, -found, (piece ids, filled, charm)), best first, charm
+    being an index into inventory or None. share is an optional (index,
+    count) and only every count-th head group starting at index is
+    searched. stats is a SearchStats that is kept up to date and
+    progress is called like it is for search_sets, but with the entries
+    instead of the sets. cancelled is checked as for search_sets.
+    avoid, inventory and the minimums are as for search_sets.
+    """
+    if stats is None:
+        stats = SearchStats()
+    trees = search_trees(wanted_skills, data, avoid, inventory)
+    if not trees or limit <= 0:
+        return []
+    usable = [usable_pieces(data, part, gender, weapon, use_parts)
+              for part in PARTS]
+    copies = most_copies(data, usable)
+    # The Torso Up columns are only there if a set can have Torso Up.
+    counts = () if copies == 1 else (0, 0)
+    size = len(trees) + len(counts)
+    need = tuple(x[2] for x in trees) + counts
+    order = key_order(sort_type, ties)
+    useful = useful_jewels(data, trees)
+    fills = decorations.jewel_fills(useful, len(trees))
+    useful = [(vector + counts, slots, index) for vector, slots, index in
+              useful]
+    best_fill = [tuple(max(x[0][i] for x in kind)
+                       for i in range(len(trees))) + counts
+                 for kind in decorations.kind_fills(fills, copies)]
+    vectors = tree_vectors(data, data.piece_skills, trees)
+    if counts:
+        vectors = numpy.hstack([vectors, torso_columns(
+            data, numpy.arange(len(vectors)))])
+    vectors = vectors.tolist()
+    # The resistances with a minimum, only these are looked at.
+    elements, resist_need = resistance_floors(min_resistance)
+    resists = data.resistance[:, elements].tolist()
+    no_resist = tuple(0 for _ in elements)
+
+    def grouped(rows):
+        # Pieces that give the same points and have the same slots can be
+        # swapped for each other, so the search is done over these groups
+        # and the pieces in them are only looked at once a set is found.
+        # Each group has the most of each resistance any of them has, and
+        # after it the kind of its slots and what they count as.
+        groups = {}
+        for vector, kind, defense, name, index, resist in rows:
+            groups.setdefault((vector, kind), []).append((defense, name,
+                                                          index, resist))
+        pieces = []
+        for (vector, kind), members in groups.items():
+            members.sort(key=lambda x: (-x[0], x[1]))
+            optimistic = tuple(a + b for a, b in zip(vector,
+                                                     best_fill[kind]))
+            pieces.append((members, vector, decorations.kind_slots(kind),
+                           optimistic, members[0][0],
+                           tuple(map(max, zip(no_resist, *[x[3] for x in
+                                                           members])))
+                           if elements else no_resist, kind,
+                           decorations.kind_capacity(kind)))
+        pieces.sort(key=lambda x: (sum(min(a, b) for a, b in
+                                       zip(x[3], need)),
+                                   set_key(order, x[4], x[2])),
+                    reverse=True)
+        return pieces
+
+    def counted(index, times):
+        # The points of a piece, for a chest counted `times` times with
+        # the Torso Up pieces the set then needs in the columns after the
+        # trees.
+        if times == 1:
+            return tuple(vectors[index])
+        return tuple(times * x for x in vectors[index][:len(trees)]) + (
+            1 - times, times - 1)
+
+    candidates = []
+    for part, pieces in zip(PARTS, usable):
+        candidates.append(grouped(
+            (counted(index, times), decorations.slot_kind(
+                int(data.piece_slots[index]), times),
+             int(data.defense_max[index]), data.piece_names[index], index,
+             tuple(resists[index]))
+            for index in pieces
+            for times in range(1, (copies if part == 'chest' else 1) + 1)))
+    # The charm is one more part, searched just before the last two so
+    # the head pieces can still be shared out and the last two paired.
+    charm_depth = None
+    if inventory:
+        charm_depth = len(PARTS) - 2
+        candidates.insert(charm_depth, grouped(
+            (vector + counts, slots, 0, '' if index is None else
+             inventory[index].name, index, no_resist) for vector, slots,
+            index in charm_pieces(data, inventory, trees, fills)))
+
+    # rem[depth] is the most points the parts from depth onwards can give
+    # with jewels, rem_armour without them. The slots are what they count
+    # as, so a chest counted twice has twice its slots.
+    rem = [tuple(0 for _ in need)]
+    rem_armour = [tuple(0 for _ in need)]
+    rem_defense = [0]
+    rem_slots = [0]
+    rem_resist = [no_resist]
+    lowest = list(need)
+    for pieces in reversed(candidates):
+        if not pieces:
+            return []
+        rem.insert(0, tuple(rem[0][i] + max(x[3][i] for x in pieces)
+                            for i in range(size)))
+        rem_armour.insert(0, tuple(rem_armour[0][i] + max(x[1][i] for x in
+                                                          pieces)
+                                   for i in range(size)))
+        for i in range(size):
+            lowest[i] -= min(0, min(x[1][i] for x in pieces))
+        rem_defense.insert(0, rem_defense[0] + max(x[4] for x in pieces))
+        rem_slots.insert(0, rem_slots[0] + max(x[7] for x in pieces))
+        rem_resist.insert(0, tuple(rem_resist[0][i] + max(x[5][i] for x in
+                                                          pieces)
+                                   for i in range(len(elements))))
+    # Sets that can never have the minimums are not searched at all.
+    if (rem_defense[0] < min_defense or
+            rem_slots[0] + weapon_slots < min_slots or
+            not all(map(operator.ge, rem_resist[0], resist_need))):
+        return []
+    # The avoided trees come last and do not count towards the points.
+    solver = decorations.Decorations(useful, lowest,
+                                     sum(points > 0 for points in need),
+                                     copies)
+    slot_cost = solver.slot_cost
+    if share is not None:
+        candidates[0] = candidates[0][share[0]::share[1]]
+        if not candidates[0]:
+            return []
+
+    # Every pair of groups for the last two parts, as arrays.
+    pairs = list(itertools.product(candidates[-2], candidates[-1]))
+    pair_optimistic = numpy.array([tuple(map(operator.add, a[3], b[3]))
+                                   for a, b in pairs])
+    pair_armour = numpy.array([tuple(map(operator.add, a[1], b[1]))
+                               for a, b in pairs])
+    pair_slots = numpy.array([a[7] + b[7] for a, b in pairs])
+    pair_defense = numpy.array([a[4] + b[4] for a, b in pairs])
+    pair_resist = numpy.array([tuple(map(operator.add, a[5], b[5]))
+                               for a, b in pairs]).reshape(len(pairs), -1)
+    paired = len(candidates) - 2
+
+    results = TopK(limit)
+    chosen = [None] * len(candidates)
+    # When progress is next reported and the version of the results it
+    # was last reported with.
+    reported = [time.time() + PROGRESS_INTERVAL, -1]
+
+    def report():
+        reported[0] = time.time() + PROGRESS_INTERVAL
+        if results.version == reported[1]:
+            progress(None, stats)
+        else:
+            reported[1] = results.version
+            progress(results.snapshot(), stats)
+
+    def add(depth, defense, resist, free, ids, filled, best_after):
+        if depth == len(chosen):
+            pieces = list(ids)
+            charm = None if charm_depth is None else pieces.pop(charm_depth)
+            results.push(set_key(order, defense, free, -filled[0]),
+                         (tuple(pieces), filled, charm))
+            return
+        for piece_defense, _, index, piece_resist in chosen[depth][0]:
+            most = defense + piece_defense + best_after[depth + 1][0]
+            if most < min_defense or results.rejects(set_key(
+                    order, most, free, -filled[0])):
+                break
+            now = tuple(map(operator.add, resist, piece_resist))
+            if not all(map(operator.ge, map(operator.add, now,
+                                            best_after[depth + 1][1]),
+                           resist_need)):
+                continue
+            ids.append(index)
+            add(depth + 1, defense + piece_defense, now, free, ids, filled,
+                best_after)
+            ids.pop()
+
+    def finish(vector):
+        # The best resistances of the groups chosen go first, these can
+        # rule out all their sets before the jewels are looked for.
+        best_after = [(0, no_resist)]
+        for piece in reversed(chosen):
+            best_after.insert(0, (best_after[0][0] + piece[4],
+                                  tuple(map(operator.add, best_after[0][1],
+                                            piece[5]))))
+        if not all(map(operator.ge, best_after[0][1], resist_need)):
+            return
+        # The weapon is the last piece.
+        layout = [piece[6] for piece in chosen] + [weapon_slots]
+        slots = weapon_slots + sum(piece[2] for piece in chosen)
+        filled = solver.solve_layout(map(operator.sub, need, vector), layout)
+        if filled is None or slots - filled[1] < min_slots:
+            return
+        if charm_depth is not None:
+            # The charm's jewels go after the weapon's.
+            jewels = filled[2]
+            filled = (filled[0], filled[1], jewels[:charm_depth] +
+                      jewels[charm_depth + 1:] + (jewels[charm_depth],))
+        add(0, 0, no_resist, slots - filled[1], [], filled, best_after)
+
+    def visit_pairs(optimistic, vector, defense, slots, resist):
+        check_cancelled(cancelled)
+        indexes = numpy.flatnonzero((pair_optimistic >= numpy.subtract(
+            need, optimistic)).all(axis=1))
+        room = slots + pair_slots[indexes] - slot_cost.batch(
+            numpy.subtract(need, vector) - pair_armour[indexes])
+        ok = ((room >= min_slots) &
+              (defense + pair_defense[indexes] >= min_defense) &
+              (pair_resist[indexes] >= numpy.subtract(
+                  resist_need, resist)).all(axis=1))
+        if results.full():
+            ok &= beats(results.worst(), set_key(
+                order, defense + pair_defense[indexes], room), len(indexes))
+        stats.evaluated += len(pairs)
+        stats.pruned += len(pairs)
+        for index, free in zip(indexes[ok].tolist(), room[ok].tolist()):
+            first, second = pairs[index]
+            if results.rejects(set_key(order, defense + first[4] + second[4],
+                                       free)):
+                continue
+            stats.pruned -= 1
+            chosen[paired] = first
+            chosen[paired + 1] = second
+            finish(tuple(map(operator.add, vector,
+                             pair_armour[index].tolist())))
+        if progress is not None and time.time() >= reported[0]:
+            report()
+
+    def visit(depth, optimistic, vector, defense, slots, resist):
+        if depth == paired:
+            visit_pairs(optimistic, vector, defense, slots, resist)
+            return
+        # The points the next piece has to give for the set to still
+        # be possible, with and without jewels.
+        floor = [need[i] - optimistic[i] - rem[depth + 1][i]
+                 for i in range(size)]
+        armour_floor = [need[i] - vector[i] - rem_armour[depth + 1][i]
+                        for i in range(size)]
+        after_defense = defense + rem_defense[depth + 1]
+        after_slots = slots + rem_slots[depth + 1]
+        resist_floor = [resist_need[i] - resist[i] - rem_resist[depth + 1][i]
+                        for i in range(len(elements))]
+        stats.evaluated += len(candidates[depth])
+        for piece in candidates[depth]:
+            check_cancelled(cancelled)
+            if (after_defense + piece[4] < min_defense or results.rejects(
+                    set_key(order, after_defense + piece[4],
+                            after_slots + piece[7]))):
+                stats.pruned += 1
+                continue
+            if not (all(map(operator.ge, piece[3], floor)) and
+                    all(map(operator.ge, piece[5], resist_floor))):
+                stats.pruned += 1
+                continue
+            room = after_slots + piece[7]
+            room -= slot_cost(list(map(operator.sub, armour_floor,
+                                       piece[1])))
+            if room < min_slots or results.rejects(set_key(
+                    order, after_defense + piece[4], room)):
+                stats.pruned += 1
+                continue
+            chosen[depth] = piece
+            visit(depth + 1, tuple(map(operator.add, optimistic, piece[3])),
+                  tuple(map(operator.add, vector, piece[1])),
+                  defense + piece[4], slots + piece[7],
+                  tuple(map(operator.add, resist, piece[5])))
+
+    def join(upper, lower, halves_up, halves_down, vector, free):
+        if results.rejects(set_key(order, int(halves_up[1][0] +
+                                              halves_down[1][0]), free)):
+            stats.pruned += 1
+            return
+        # All the sets of an upper and a lower bucket can use the same
+        # jewels, so if they cannot none of them can.
+        histogram = list(upper[2] + lower[2])
+        if weapon_slots:
+            histogram[weapon_slots - 1] += 1
+        if solver.solve(tuple(map(operator.sub, need, vector)),
+                        tuple(histogram)) is None:
+            stats.pruned += 1
+            return
+        for up, up_defense in zip(*halves_up):
+            if up_defense + halves_down[1][0] < min_defense or (
+                    results.rejects(set_key(order, up_defense +
+                                            halves_down[1][0], free))):
+                break
+            for down, down_defense in zip(*halves_down):
+                if up_defense + down_defense < min_defense or (
+                        results.rejects(set_key(order, up_defense +
+                                                down_defense, free))):
+                    break
+                for depth, group in enumerate(up.tolist() + down.tolist()):
+                    chosen[depth] = candidates[depth][group]
+                finish(vector)
+
+    def visit_halves():
+        # The head, chest and arms are joined with the waist and legs, a
+        # block of upper halves with every lower half at a time.
+        upper = half_sets(candidates[:paired], size, solver.kinds,
+                          cancelled)
+        lower = half_sets(candidates[paired:], size, solver.kinds,
+                          cancelled)
+        down_ranked = rank_halves(lower, 0, 0)
+        lower = [x[down_ranked] for x in lower[:5]] + [
+            [lower[5][i] for i in down_ranked.tolist()]]
+        # The best key a set with each upper half could have, which goes
+        # down through the blocks unless the sort is 'Default', where it
+        # is always no points past the wanted ones.
+        most_defense = int(lower[4].max())
+        most_slots = weapon_slots + int(lower[3].max())
+        ranked = rank_halves(upper, most_defense, most_slots)
+        # The weapon's jewels count towards the points too.
+        target = numpy.subtract(need, best_fill[weapon_slots])
+        # The Torso Up pieces of the two halves have to add up to how
+        # many more times the upper one counts its chest, so an upper
+        # half is only tried with the lower halves that have the rest.
+        upper_torso = numpy.zeros(len(upper[0]), dtype=int)
+        lower_torso = numpy.zeros(len(lower[0]), dtype=int)
+        if counts:
+            upper_torso = -upper[0][:, len(trees)]
+            lower_torso = lower[0][:, len(trees)]
+        torso_lower = [(torso, numpy.flatnonzero(lower_torso == torso))
+                       for torso in numpy.unique(lower_torso).tolist()]
+        for start in range(0, len(ranked), HALF_BLOCK):
+            check_cancelled(cancelled)
+            block = ranked[start:start + HALF_BLOCK]
+            if results.rejects(set_key(
+                    order, int(upper[4][block[0]]) + most_defense,
+                    int(upper[3][block[0]]) + most_slots)):
+                stats.pruned += len(ranked) - start
+                break
+            up = []
+            down = []
+            for torso, downs in torso_lower:
+                ups = block[upper_torso[block] == torso]
+                found = numpy.nonzero((upper[1][ups][:, None, :] +
+                                       lower[1][downs][None, :, :] >=
+                                       target).all(axis=2))
+                up.append(ups[found[0]])
+                down.append(downs[found[1]])
+            up = numpy.concatenate(up)
+            down = numpy.concatenate(down)
+            vectors = upper[0][up] + lower[0][down]
+            room = (weapon_slots + upper[3][up] + lower[3][down] -
+                    slot_cost.batch(numpy.subtract(need, vectors)))
+            ok = ((room >= min_slots) &
+                  (upper[4][up] + lower[4][down] >= min_defense))
+            if results.full():
+                ok &= beats(results.worst(), set_key(
+                    order, upper[4][up] + lower[4][down], room), len(up))
+            stats.evaluated += len(block) * len(lower[0])
+            stats.pruned += len(block) * len(lower[0]) - int(ok.sum())
+            for a, b, free in zip(up[ok].tolist(), down[ok].tolist(),
+                                  room[ok].tolist()):
+                join([x[a] for x in upper[:4]], [x[b] for x in lower[:4]],
+                     upper[5][a], lower[5][b],
+                     tuple((upper[0][a] + lower[0][b]).tolist()), free)
+            if progress is not None and time.time() >= reported[0]:
+                report()
+
+    def rank_halves(table, more_defense, more_slots):
+        # The order the buckets of half_sets are tried in, by the best key
+        # they could give with the other half unless the sort is
+        # 'Default', then the most wanted points first like the pieces.
+        check_cancelled(cancelled)
+        score = numpy.minimum(table[1], need).sum(axis=1)
+        keys = set_key(order, table[4] + more_defense,
+                       table[3] + more_slots, numpy.zeros_like(score))
+        # lexsort sorts by its last column first, and is stable.
+        return numpy.lexsort([-score] + [-x for x in reversed(keys)])
+
+    if halves:
+        visit_halves()
+    else:
+        visit(0, best_fill[weapon_slots], tuple(0 for _ in need), 0,
+              weapon_slots, no_resist)
+    if progress is not None:
+        report()
+    return results.snapshot()
+
+
+# The game data given to each worker process when it starts, so it does
+# not have to be sent along with every share.
+worker_data = None
+# The SearchSession of a worker process running whole searches, so the
+# searches it is given share what the pruning works out.
+worker_session = None
+
+
+def start_worker(data):
+    global worker_data
+    worker_data = data
+
+
+def search_share(arguments):
+    """search_share
+    Runs search_entries in a worker process on the game data it was
+    started with. arguments are the wanted skills, a dict of the other
+    options and the share. Returns the index of the share, the entries
+    and the SearchStats.
+    """
+    wanted_skills, options, share = arguments
+    stats = SearchStats()
+    entries = search_entries(wanted_skills, worker_data, share=share,
+                             stats=stats, **options)
+    return share[0], entries, stats
+
+
+def search_query(arguments):
+    """search_query
+    Runs a whole search in a worker process for search_batch, with the
+    worker's SearchSession. arguments are the index of the search, the
+    wanted skills and the other options of SearchSession.search.
+    Returns the index and the sets.
+    """
+    global worker_session
+    index, wanted_skills, options = arguments
+    if worker_session is None or worker_session.data is not worker_data:
+        worker_session = SearchSession(worker_data)
+    return index, worker_session.search(wanted_skills, **options)
+
+
+def search_batch(queries, data, workers=1):
+    """search_batch
+    Runs many searches of one game, yielding (index, sets) for each of
+    queries as it is done. queries are (wanted skills, options) with the
+    options of SearchSession.search. With more than one worker that many
+    searches run at once, each in its own process, which is given the
+    game data once. Every process keeps a SearchSession for the searches
+    it runs, and the ones with fewer skills are started first, so the
+    pruning of the others can start from theirs.
+    """
+    arguments = sorted(((index, list(wanted_skills), options)
+                        for index, (wanted_skills, options) in
+                        enumerate(queries)), key=lambda x: len(x[1]))
+    if workers <= 1:
+        session = SearchSession(data)
+        for index, wanted_skills, options in arguments:
+            yield index, session.search(wanted_skills, **options)
+        return
+    with multiprocessing.Pool(workers, start_worker, (data,)) as pool:
+        yield from pool.imap_unordered(search_query, arguments)
+
+
+def merge_entries(found, limit):
+    """merge_entries
+    Merges the entries the shares found into the best `limit`, skipping
+    the shares that are not done yet.
+    """
+    return list(itertools.islice(heapq.merge(
+        *[x for x in found if x is not None], key=lambda x: x[:2],
+        reverse=True), limit))
+
+
+def entry_sets(data, entries, weapon_slots=0, inventory=None):
+    """entry_sets
+    Turns the entries of search_entries into ArmourSets, with the charms
+    of inventory.
+    """
+    return [model.ArmourSet(ids, filled[2], weapon_slots, -filled[0],
+                            None if charm is None else inventory[charm])
+            for _, _, (ids, filled, charm) in entries]
+
+
+def search_sets(wanted_skills, data, gender='Both', weapon='Both',
+                sort_type='Default', limit=100, use_parts=None, workers=1,
+                prune=True, weapon_slots=0, ties=(), progress=None,
+                cancelled=None, stats=None, halves=False, avoid=(),
+                inventory=None, min_defense=0, min_resistance=None,
+                min_slots=0):
+    """search_sets
+    Finds the best `limit` armour sets that activate all the wanted
+    skills, ranked by the sort type. data is the compiled GameData of
+    the game. Returns the sets best first as model.ArmourSets. The
+    points of a set are how far it goes past the wanted skill points, 0
+    is an exact match.
+
+    With more than one worker the head pieces are shared out between
+    that many processes and their top results are merged. With prune the
+    pieces that can never give a better set are dropped first, so the
+    best set is the same but the runners up only use pieces nothing
+    beats. weapon_slots is how many slots the weapon has for jewels,
+    the jewels put in it are the last of the jewel tuples. ties are more
+    of 'defense', 'slots' and 'points' to break ties in the sort type
+    with, see key_order.
+
+    progress is called as progress(sets, stats) at most every
+    PROGRESS_INTERVAL seconds while searching and once more at the end,
+    with the best sets so far or None if they did not change since the
+    last call, and a SearchStats.
+
+    cancelled is an optional threading.Event, the search checks it as it
+    goes and raises Cancelled soon after it is set. stats is an optional
+    SearchStats to count in.
+
+    With halves every (head, chest, arms) is worked out first, and every
+    (waist, legs), each side bucketed by points and slots, and then the
+    buckets are joined. This is much quicker when there are a lot of
+    pieces, like when the pieces are not pruned. The sets it finds with
+    the 'Default' sort can be others, as they are found in another
+    order.
+
+    avoid are skills the sets must not have, like negative skills. The
+    search drops the sets that would have them as it goes, the same way
+    as the ones short of the wanted points.
+
+    inventory is an optional list of charms.Charm, the charms the player
+    has. Each set then has the best one of them, or none, as one more
+    part with its points and slots. The charms another charm beats for
+    the wanted skills are dropped first.
+
+    min_defense is the least max defense, min_resistance a dict of
+    element to the least resistance and min_slots the least free slots
+    the sets must have. The most each part can add to these is known, so
+    partial sets that can never have them are not searched any further.
+    """
+    if stats is None:
+        stats = SearchStats()
+    if progress is None:
+        report = None
+    else:
+        def report(entries, stats):
+            progress(None if entries is None else
+                     entry_sets(data, entries, weapon_slots, inventory),
+                     stats)
+    elements, _ = resistance_floors(min_resistance)
+    if prune:
+        # A piece with less of a resistance that has a minimum can not
+        # be dropped for one with more points.
+        use_parts, stats.removed = prune_pieces(
+            wanted_skills, data, gender, weapon, use_parts,
+            elements, avoid, inventory, cancelled)
+    options = dict(gender=gender, weapon=weapon, sort_type=sort_type,
+                   limit=limit, use_parts=use_parts,
+                   weapon_slots=weapon_slots, ties=ties, halves=halves,
+                   avoid=avoid, inventory=inventory, min_defense=min_defense,
+                   min_resistance=min_resistance, min_slots=min_slots)
+    if workers <= 1:
+        results = search_entries(wanted_skills, data, stats=stats,
+                                 progress=report, cancelled=cancelled,
+                                 **options)
+    else:
+        count = workers * SHARES_PER_WORKER
+        shares = [(wanted_skills, options, (index, count))
+                  for index in range(count)]
+        found = [None] * count
+        next_report = time.time() + PROGRESS_INTERVAL
+        with multiprocessing.Pool(workers, start_worker, (data,)) as pool:
+            done = pool.imap_unordered(search_share, shares, chunksize=1)
+            # Leaving the pool stops the workers if this is cancelled.
+            while None in found:
+                check_cancelled(cancelled)
+                try:
+                    index, entries, share_stats = done.next(CANCEL_POLL)
+                except multiprocessing.TimeoutError:
+                    continue
+                found[index] = entries
+                stats.add(share_stats)
+                if report is not None and (time.time() >= next_report or
+                                           None not in found):
+                    next_report = time.time() + PROGRESS_INTERVAL
+                    report(merge_entries(found, limit), stats)
+        results = merge_entries(found, limit)
+    return entry_sets(data, results, weapon_slots, inventory)
+
+
+class SearchSession:
+    """SearchSession
+    Searches one game again and again as skills are ticked and unticked,
+    keeping what the pruning worked out for the next search. The usable
+    pieces and the beat_pairs of each part are kept while the gender,
+    weapon and allowed pieces stay the same. The pairs that beat each
+    other are kept for the last SESSION_SIZE sets of wanted trees, and a
+    search starts from the pairs of the biggest of those it has all the
+    trees of, as wanting more trees only takes pairs away. Adding a
+    skill starts from the search before it, removing one goes back to
+    the pairs of a search with fewer skills or to beat_pairs. A search
+    that another one took over from may still be pruning, so only one
+    prunes at a time.
+    """
+
+    def __init__(self, data, size=SESSION_SIZE):
+        self.data = data
+        self.size = size
+        self.lock = threading.Lock()
+        self.filters = None
+        # part -> (piece ids, beat_pairs) for the filters.
+        self.parts = {}
+        # frozenset of (tree, sign) -> part -> the pairs that beat.
+        self.known = collections.OrderedDict()
+
+    def part_pieces(self, gender, weapon, use_parts, cancelled=None):
+        """part_pieces
+        The usable piece ids and their beat_pairs for every part, worked
+        out again only when the filters change. cancelled is checked as
+        for search_sets, and the session is left as it was if it is set.
+        """
+        filters = (gender, weapon, None if use_parts is None else
+                   tuple(tuple(sorted(use_parts[part])) for part in PARTS))
+        if filters != self.filters:
+            parts = {}
+            for part in PARTS:
+                check_cancelled(cancelled)
+                pieces = numpy.array(usable_pieces(self.data, part, gender,
+                                                   weapon, use_parts),
+                                     dtype=int)
+                parts[part] = (pieces, beat_pairs(
+                    self.data.piece_slots[pieces],
+                    self.data.defense_max[pieces],
+                    torso_columns(self.data, pieces)))
+            self.filters = filters
+            self.known.clear()
+            self.parts = parts
+        return self.parts
+
+    def prune(self, wanted_skills, gender='Both', weapon='Both',
+              use_parts=None, resistances=(), avoid=(), inventory=None,
+              cancelled=None):
+        """prune
+        Does what prune_pieces does, with the same result, starting from
+        what the session knows. Needing a resistance too only takes pairs
+        away, like another tree does. Nothing is kept from a prune that
+        is cancelled.
+        """
+        data = self.data
+        trees = search_trees(wanted_skills, data, avoid, inventory)
+        if not trees:
+            return use_parts, 0
+        parts = self.part_pieces(gender, weapon, use_parts, cancelled)
+        signed = frozenset((tree, sign) for tree, sign, _ in trees)
+        signed |= {('resistance', column) for column in resistances}
+        start = None
+        for known in self.known:
+            if known <= signed and (start is None or len(known) > len(start)):
+                start = known
+        fills = decorations.jewel_fills(useful_jewels(data, trees),
+                                        len(trees), cancelled)
+        vectors = tree_vectors(data, data.piece_skills, trees)
+        kept = {}
+        found = {}
+        removed = 0
+        for part in PARTS:
+            check_cancelled(cancelled)
+            pieces, pairs = parts[part]
+            if start is not None:
+                pairs = self.known[start][part]
+            if resistances:
+                extra = data.resistance[pieces][:, list(resistances)]
+                pairs = tuple(x[(extra[pairs[0]] >= extra[pairs[1]]).all(
+                    axis=1)] for x in pairs)
+            mask, found[part] = dominated(vectors[pieces],
+                                          data.piece_slots[pieces],
+                                          data.defense_max[pieces], fills,
+                                          pairs=pairs, cancelled=cancelled)
+            kept[part] = [data.piece_names[i] for i in pieces[~mask]]
+            removed += int(mask.sum())
+        self.known[signed] = found
+        self.known.move_to_end(signed)
+        while len(self.known) > self.size:
+            self.known.popitem(last=False)
+        return kept, removed
+
+    def search(self, wanted_skills, gender='Both', weapon='Both',
+               use_parts=None, prune=True, cancelled=None, **options):
+        """search
+        search_sets for the session's game, with the pruning done by the
+        session.
+        """
+        stats = SearchStats()
+        if prune:
+            with self.lock:
+                check_cancelled(cancelled)
+                use_parts, stats.removed = self.prune(
+                    wanted_skills, gender, weapon, use_parts,
+                    resistance_floors(options.get('min_resistance'))[0],
+                    options.get('avoid', ()), options.get('inventory'),
+                    cancelled)
+        return search_sets(wanted_skills, self.data, gender, weapon,
+                           use_parts=use_parts, prune=False,
+                           cancelled=cancelled, stats=stats, **options)
+
+
+class SearchJob:
+    """SearchJob
+    A search_sets call run on its own thread, which can be cancelled.
+    state is 'waiting' until it is started, then 'running' and at the
+    end 'done', 'cancelled' or 'failed'. stats is the SearchStats of the
+    last progress report, results the sets once it is done and error
+    the exception if it failed.
+
+    progress is called like it is for search_sets but never after the
+    job is cancelled, and finished is called with the job once it ends
+    however it ends. Both are called on the job's thread. cache is an
+    optional querycache.QueryCache, the results are taken from it if
+    the query is in it and saved to it otherwise. session is an optional
+    SearchSession for data that the search is done with.
+    """
+
+    def __init__(self, wanted_skills, data, progress=None, finished=None,
+                 cache=None, session=None, **options):
+        self.wanted_skills = wanted_skills
+        self.data = data
+        self.options = options
+        self.cache = cache
+        self.session = session
+        self.progress = progress
+        self.finished = finished
+        self.state = 'waiting'
+        self.stats = None
+        self.results = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.ended = threading.Event()
+        self.thread = None
+
+    def start(self, previous=None):
+        """start
+        Starts the search, cancelling previous first if it is given so
+        a new query takes over from the one still running. Returns the
+        job.
+        """
+        if previous is not None:
+            previous.cancel()
+        self.state = 'running'
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            if self.cache is not None:
+                self.results = self.cache.lookup(self.wanted_skills,
+                                                 self.data, self.options)
+            if self.results is None:
+                if self.session is None:
+                    search = functools.partial(search_sets,
+                                               data=self.data)
+                else:
+                    search = self.session.search
+                self.results = search(self.wanted_skills,
+                                      progress=self.report,
+                                      cancelled=self.cancelled,
+                                      **self.options)
+                self.save()
+            else:
+                stats = SearchStats()
+                stats.cached = True
+                self.report(self.results, stats)
+            self.state = 'done'
+        except Cancelled:
+            self.state = 'cancelled'
+        except Exception as error:
+            self.error = error
+            self.state = 'failed'
+        try:
+            if self.finished is not None:
+                self.finished(self)
+        finally:
+            self.ended.set()
+        return None
+
+    def save(self):
+        if self.cache is None:
+            return None
+        try:
+            self.cache.store(self.wanted_skills, self.data, self.options,
+                             self.results)
+        except OSError as error:
+            print('Could not save the results: {}'.format(error),
+                  file=sys.stderr)
+        return None
+
+    def report(self, sets, stats):
+        self.stats = stats
+        if self.progress is not None and not self.cancelled.is_set():
+            self.progress(sets, stats)
+        return None
+
+    def cancel(self):
+        """cancel
+        Asks the search to stop, it does so the next time it checks.
+        """
+        self.cancelled.set()
+        return None
+
+    def running(self):
+        return self.state == 'running'
+
+    def wait(self, timeout=None):
+        """wait
+        Waits for the job to end. Returns False if it timed out.
+        """
+        return self.ended.wait(timeout)
@@ -0,0 +1,433 @@
+"""model
+The game data compiled into NumPy arrays.
+
+The armour, jewels and skills json is turned into integer matrices once
+when a game is loaded, pieces by skill trees and jewels by skill trees,
+along with the slots, defense and resistances of every piece. Names are
+looked up through the index tables, and the posting tables list the
+pieces and jewels of every skill tree so they do not have to be found
+by going through all of them. The skills of every tree are listed by
+the points they need, so the skills a set has are looked up instead of
+going through the skills json. The pieces of every part are also
+listed by rarity, so the ones in a rarity range are found with a
+bisect. The skill points, defense and slots of many sets can then be
+worked out in one go instead of walking the json dicts of every piece
+for every set.
+
+Torso Up pieces give no points of their own but count the chest again,
+the jewels in it included, once for each of them in the set.
+
+The compiled data can be saved to a cache folder, the arrays as .npy
+files that are memory mapped when they are loaded back, so a game does
+not have to be parsed and compiled again until its json changes.
+"""
+
+
+import bisect
+import collections
+import os
+import pickle
+
+import numpy
+
+
+PARTS = ['Head', 'Chest', 'Arms', 'Waist', 'Legs']
+# Where the chest is in the pieces of a set.
+CHEST = PARTS.index('Chest')
+RESISTANCES = ['Fire', 'Water', 'Thunder', 'Ice', 'Dragon']
+# The attributes of GameData saved as .npy files and the ones pickled.
+ARRAYS = ['piece_skills', 'piece_part', 'piece_slots', 'defense_min',
+          'defense_max', 'rarity', 'hr', 'elder', 'resistance',
+          'torso_up', 'jewel_skills', 'jewel_slots']
+TABLES = ['armour', 'jewels', 'skills', 'trees', 'tree_index',
+          'piece_names', 'piece_index', 'jewel_names', 'jewel_index',
+          'part_lists', 'piece_postings', 'jewel_postings', 'tree_skills',
+          'rarity_lists']
+# Goes up when what is saved changes so old caches are not used.
+CACHE_VERSION = 6
+# The fields of the armour json that are numbers, some games write them
+# as strings.
+NUMBER_FIELDS = ['rarity', 'slots', 'hr', 'elder']
+
+
+class ArmourSet(collections.namedtuple('ArmourSet', ['pieces', 'jewels',
+                                                     'weapon_slots',
+                                                     'points', 'charm'],
+                                       defaults=[None])):
+    """ArmourSet
+    A set as the piece ids of the five parts in PARTS order and the jewel
+    ids put in each of them, a tuple per part with the weapon's next and
+    the charm's last if it has one. points is how far the set goes past
+    the wanted skill points. charm is the charms.Charm of the set or
+    None.
+    """
+    __slots__ = ()
+
+
+def jewel_name(item):
+    return list(item.keys())[0]
+
+
+def piece_sort(name, item):
+    """piece_sort
+    The order pieces are listed in, Torso Up pieces first then the
+    highest rarity.
+    """
+    return ('Torso Up' not in item['skills'], -item['rarity'], name)
+
+
+def unique_jewels(jewels):
+    """unique_jewels
+    The jewels json with every jewel once, the first of each name kept.
+    The games list some jewels twice, MHFU once for every way to make
+    them, which would only give the solver the same jewel again.
+    """
+    seen = set()
+    found = []
+    for item in jewels:
+        if jewel_name(item) not in seen:
+            seen.add(jewel_name(item))
+            found.append(item)
+    return found
+
+
+def normalize_armour(armour):
+    """normalize_armour
+    Turns the number fields of the armour json into ints in place, once
+    when a game is loaded.
+    """
+    for item in armour.values():
+        for field in NUMBER_FIELDS:
+            if field in item:
+                item[field] = int(item[field])
+    return armour
+
+
+class GameData:
+    """GameData
+    The compiled data for one game. The json it was made from is kept in
+    armour, jewels and skills.
+    """
+
+    def __init__(self, armour, jewels, skills):
+        self.armour = normalize_armour(armour)
+        self.jewels = jewels = unique_jewels(jewels)
+        self.skills = skills
+
+        trees = set(skill['Jewel'] for skill in skills.values())
+        for item in armour.values():
+            trees.update(item['skills'])
+        for item in jewels:
+            trees.update(item[jewel_name(item)]['Skills'])
+        self.trees = sorted(trees)
+        self.tree_index = {name: i for i, name in enumerate(self.trees)}
+        # tree -> [(points, skill)] by points, the tiers of its skills.
+        self.tree_skills = {}
+        for name, skill in skills.items():
+            self.tree_skills.setdefault(skill['Jewel'], []).append(
+                (int(skill['Points']), name))
+        for tiers in self.tree_skills.values():
+            tiers.sort()
+
+        self.piece_names = sorted(armour)
+        self.piece_index = {name: i for i, name in
+                            enumerate(self.piece_names)}
+        count = len(self.piece_names)
+        self.piece_skills = numpy.zeros((count, len(self.trees)),
+                                        dtype=numpy.int16)
+        self.piece_part = numpy.zeros(count, dtype=numpy.int8)
+        self.piece_slots = numpy.zeros(count, dtype=numpy.int8)
+        self.defense_min = numpy.zeros(count, dtype=numpy.int16)
+        self.defense_max = numpy.zeros(count, dtype=numpy.int16)
+        self.rarity = numpy.zeros(count, dtype=numpy.int8)
+        # The hunter and elder rank a piece needs, MHFU only, 0 if the
+        # game does not say.
+        self.hr = numpy.zeros(count, dtype=numpy.int8)
+        self.elder = numpy.zeros(count, dtype=numpy.int8)
+        self.resistance = numpy.zeros((count, len(RESISTANCES)),
+                                      dtype=numpy.int16)
+        # 1 for the Torso Up pieces, how many more times each counts the
+        # chest.
+        self.torso_up = numpy.zeros(count, dtype=numpy.int8)
+        # tree -> part -> [(piece id, points)] in id order, for the pieces
+        # that list the tree.
+        self.piece_postings = {}
+        for index, name in enumerate(self.piece_names):
+            item = armour[name]
+            for tree, points in item['skills'].items():
+                self.piece_skills[index, self.tree_index[tree]] = int(points)
+                self.piece_postings.setdefault(tree, {}).setdefault(
+                    item['part'], []).append((index, int(points)))
+            self.piece_part[index] = PARTS.index(item['part'])
+            self.piece_slots[index] = int(item['slots'])
+            self.defense_min[index] = int(item['defense']['min'])
+            self.defense_max[index] = int(item['defense']['max'])
+            self.rarity[index] = item['rarity']
+            self.hr[index] = item.get('hr', 0)
+            self.elder[index] = item.get('elder', 0)
+            # MH3U gives Torso Up pieces 10 points, MH4U 1.
+            self.torso_up[index] = (item['skills'].get('Torso Up', 0) > 0
+                                    and item['part'] != 'Chest')
+            # MH3U writes the elements in lower case.
+            for element, points in item['resistance'].items():
+                column = RESISTANCES.index(element.capitalize())
+                self.resistance[index, column] = int(points)
+
+        self.part_lists = {}
+        # part -> (rarities, piece ids) by rarity, see rarity_pieces.
+        self.rarity_lists = {}
+        for part in PARTS:
+            names = [name for name in self.piece_names
+                     if armour[name]['part'] == part]
+            self.part_lists[part] = sorted(
+                names, key=lambda name: piece_sort(name, armour[name]))
+            ids = sorted((int(self.rarity[self.piece_index[name]]),
+                          self.piece_index[name]) for name in names)
+            self.rarity_lists[part] = ([x[0] for x in ids],
+                                       [x[1] for x in ids])
+
+        # The jewel matrices have an extra row of zeros at the end so -1
+        # can be used for an empty slot.
+        self.jewel_names = [jewel_name(item) for item in jewels]
+        self.jewel_index = {name: index for index, name in
+                            enumerate(self.jewel_names)}
+        self.jewel_skills = numpy.zeros((len(jewels) + 1, len(self.trees)),
+                                        dtype=numpy.int16)
+        self.jewel_slots = numpy.zeros(len(jewels) + 1, dtype=numpy.int8)
+        # tree -> [(jewel id, points, slots)] in id order.
+        self.jewel_postings = {}
+        for index, item in enumerate(jewels):
+            data = item[self.jewel_names[index]]
+            for tree, points in data['Skills'].items():
+                self.jewel_skills[index, self.tree_index[tree]] = int(points)
+            self.jewel_slots[index] = int(data['Slots'])
+            for tree, points in data['Skills'].items():
+                self.jewel_postings.setdefault(tree, []).append(
+                    (index, int(points), int(data['Slots'])))
+
+    def part_pieces(self, part):
+        """part_pieces
+        The ids of every piece for a part, 'Head', 'Chest' and so on.
+        """
+        return numpy.flatnonzero(self.piece_part == PARTS.index(part))
+
+    def rarity_pieces(self, part, min_rarity=1, max_rarity=10, hr=None,
+                      elder=None):
+        """rarity_pieces
+        The ids of the pieces for a part with a rarity in the range, by
+        rarity. hr and elder are the most hunter and elder rank the
+        pieces can need, any if they are None.
+        """
+        rarities, ids = self.rarity_lists[part]
+        found = numpy.array(ids[bisect.bisect_left(rarities, min_rarity):
+                                bisect.bisect_right(rarities, max_rarity)],
+                            dtype=int)
+        if hr is not None:
+            found = found[self.hr[found] <= hr]
+        if elder is not None:
+            found = found[self.elder[found] <= elder]
+        return found
+
+    def tree_jewels(self, trees):
+        """tree_jewels
+        The sorted ids of the jewels that list any of the trees.
+        """
+        found = set()
+        for tree in trees:
+            found.update(x[0] for x in self.jewel_postings.get(tree, []))
+        return sorted(found)
+
+    def pieces_giving(self, tree, part=None):
+        """pieces_giving
+        The pieces that give points to a tree as (name, points), the most
+        points first, only the ones for a part if it is given.
+        """
+        postings = self.piece_postings.get(tree, {})
+        parts = PARTS if part is None else [part]
+        found = [(self.piece_names[index], points) for name in parts
+                 for index, points in postings.get(name, []) if points > 0]
+        return sorted(found, key=lambda x: (-x[1], x[0]))
+
+    def jewels_giving(self, tree):
+        """jewels_giving
+        The jewels that give points to a tree as (name, points, slots),
+        the most points for each slot first.
+        """
+        found = [(self.jewel_names[index], points, slots) for index, points,
+                 slots in self.jewel_postings.get(tree, []) if points > 0]
+        return sorted(found, key=lambda x: (-x[1] / max(x[2], 1), x[2], x[0]))
+
+    def active_skills(self, points):
+        """active_skills
+        The skills that are active with a dict of tree to points, the
+        highest tier of each tree that has enough points, or the lowest
+        negative one it has gone down to, sorted by name.
+        """
+        found = []
+        for tree, total in points.items():
+            active = None
+            for needed, name in self.tree_skills.get(tree, []):
+                if needed < 0 and total <= needed and active is None:
+                    active = name
+                elif 0 < needed <= total:
+                    active = name
+            if active is not None:
+                found.append(active)
+        return sorted(found)
+
+    def set_points(self, pieces, jewels=None, chest_jewels=None):
+        """set_points
+        The skill points of many sets at once. pieces is an (n, 5) array
+        of piece ids and jewels an optional (n, k) array of jewel ids,
+        -1 for none. chest_jewels are the ones of jewels in the chest in
+        the same form, which Torso Up counts again. Returns an (n, trees)
+        array.
+        """
+        points = self.piece_skills[pieces].sum(axis=1, dtype=numpy.int32)
+        if jewels is not None:
+            points += self.jewel_skills[jewels].sum(axis=1,
+                                                    dtype=numpy.int32)
+        chest = self.piece_skills[pieces[:, CHEST]].astype(numpy.int32)
+        if chest_jewels is not None:
+            chest += self.jewel_skills[chest_jewels].sum(axis=1,
+                                                         dtype=numpy.int32)
+        points += self.set_torso_up(pieces)[:, None] * chest
+        return points
+
+    def set_torso_up(self, pieces):
+        """set_torso_up
+        How many more times the chest is counted in many sets at once.
+        """
+        return self.torso_up[pieces].sum(axis=1, dtype=numpy.int32)
+
+    def set_defense(self, pieces):
+        """set_defense
+        The (min, max) defense of many sets at once as two arrays.
+        """
+        return (self.defense_min[pieces].sum(axis=1, dtype=numpy.int32),
+                self.defense_max[pieces].sum(axis=1, dtype=numpy.int32))
+
+    def set_slots(self, pieces):
+        """set_slots
+        The total slots of many sets at once.
+        """
+        return self.piece_slots[pieces].sum(axis=1, dtype=numpy.int32)
+
+    def set_resistance(self, pieces):
+        """set_resistance
+        The total resistances of many sets at once, one column per
+        element in RESISTANCES.
+        """
+        return self.resistance[pieces].sum(axis=1, dtype=numpy.int32)
+
+    def armour_set_ids(self, armour_set):
+        """armour_set_ids
+        The piece ids and jewel ids of an ArmourSet as two rows for the
+        set_ functions.
+        """
+        jewels = [jewel for slot in armour_set.jewels for jewel in slot]
+        return (numpy.array([armour_set.pieces]),
+                numpy.array([jewels or [-1]]))
+
+    def armour_set_names(self, armour_set):
+        """armour_set_names
+        The piece names of an ArmourSet and a list of the jewel names put
+        in each of them.
+        """
+        return ([self.piece_names[index] for index in armour_set.pieces],
+                [[self.jewel_names[index] for index in slot]
+                 for slot in armour_set.jewels])
+
+    def armour_set_slots(self, armour_set):
+        """armour_set_slots
+        The slots of an ArmourSet left after its jewels, the weapon's
+        included.
+        """
+        pieces, jewels = self.armour_set_ids(armour_set)
+        charm_slots = 0 if armour_set.charm is None else armour_set.charm.slots
+        return int(self.set_slots(pieces)[0] + armour_set.weapon_slots +
+                   charm_slots - self.jewel_slots[jewels].sum())
+
+    def armour_set_points(self, armour_set):
+        """armour_set_points
+        The skill points of an ArmourSet as a dict of tree to points
+        without the trees that have none, the charm's included.
+        """
+        pieces, jewels = self.armour_set_ids(armour_set)
+        chest_jewels = numpy.array([armour_set.jewels[CHEST] or [-1]])
+        points = self.set_points(pieces, jewels, chest_jewels)[0]
+        if armour_set.charm is not None:
+            for tree, amount in armour_set.charm.skills:
+                points[self.tree_index[tree]] += amount
+        return {self.trees[i]: int(points[i])
+                for i in numpy.flatnonzero(points)}
+
+    def armour_set_skills(self, armour_set):
+        """armour_set_skills
+        The names of the skills an ArmourSet has active.
+        """
+        return self.active_skills(self.armour_set_points(armour_set))
+
+    def armour_set_signature(self, armour_set):
+        """armour_set_signature
+        What a player can tell an ArmourSet apart by, its active skills,
+        defense, free slots and resistances. Sets with the same one only
+        differ in the pieces and jewels that give them.
+        """
+        pieces, _ = self.armour_set_ids(armour_set)
+        defense = self.set_defense(pieces)
+        return (tuple(self.armour_set_skills(armour_set)),
+                int(defense[0][0]), int(defense[1][0]),
+                self.armour_set_slots(armour_set),
+                tuple(self.set_resistance(pieces)[0].tolist()))
+
+
+def save_cache(data, folder, sources):
+    """save_cache
+    Saves a GameData to a folder. sources is anything that tells if the
+    json it was made from has changed, load_cache only uses the cache if
+    it is given the same.
+    """
+    os.makedirs(folder, exist_ok=True)
+    # Each array is written under a new name and moved over the old one,
+    # as another process can have the old file memory mapped and would
+    # crash if it was written over in place.
+    for name in ARRAYS:
+        path = os.path.join(folder, name + '.npy')
+        with open(path + '.new', 'wb') as f:
+            numpy.save(f, getattr(data, name))
+        os.replace(path + '.new', path)
+    saved = {'version': CACHE_VERSION, 'sources': sources,
+             'tables': {name: getattr(data, name) for name in TABLES}}
+    # The tables are written last and in one go, so a cache that was
+    # only half saved is never used.
+    path = os.path.join(folder, 'tables.pickle')
+    with open(path + '.new', 'wb') as f:
+        pickle.dump(saved, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.new', path)
+    return None
+
+
+def load_cache(folder, sources):
+    """load_cache
+    Loads a GameData saved by save_cache, with the arrays memory mapped.
+    Returns None if there is no cache or it was saved for other sources.
+    """
+    try:
+        with open(os.path.join(folder, 'tables.pickle'), 'rb') as f:
+            saved = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if saved.get('version') != CACHE_VERSION or (
+            saved.get('sources') != sources):
+        return None
+    data = GameData.__new__(GameData)
+    data.__dict__.update(saved['tables'])
+    try:
+        for name in ARRAYS:
+            setattr(data, name, numpy.load(os.path.join(folder, name +
+                                                        '.npy'),
+                                           mmap_mode='r'))
+    except (OSError, ValueError):
+        return None
+    return data
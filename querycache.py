@@ -0,0 +1,139 @@
+"""querycache
+Keeps the results of searches on disk so the same query is not searched
+again, even after a restart.
+
+A query is turned into a key by hashing the game, the stamps of the json
+it was loaded from, the wanted skills and every search_sets option that
+changes the results, with the defaults filled in and the lists sorted,
+so the same query always gets the same key however it was asked. Each
+result is a pickle named after its key. Looking one up touches its file,
+and once the folder is over its size the least recently used ones are
+deleted. Results for old json are never looked up again, so they age
+out the same way.
+"""
+
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+import engine
+
+
+# Goes up when the search changes what it finds, so old results are
+# not used.
+QUERY_VERSION = 4
+MAX_BYTES = 32 * 1024 * 1024
+# The search_sets options that do not change the results.
+IGNORED = ['data', 'wanted_skills', 'workers', 'progress', 'cancelled',
+           'stats']
+
+
+def query_options(options):
+    """query_options
+    The options of a search_sets call with the defaults filled in and
+    the ones that do not change the results left out.
+    """
+    found = {}
+    for name, parameter in inspect.signature(
+            engine.search_sets).parameters.items():
+        if name not in IGNORED:
+            found[name] = options.get(name, parameter.default)
+    if found['use_parts'] is not None:
+        found['use_parts'] = {part: sorted(names) for part, names in
+                              found['use_parts'].items()}
+    found['ties'] = list(found['ties'])
+    found['avoid'] = sorted(set(found['avoid']))
+    return found
+
+
+def query_key(wanted_skills, data, options):
+    """query_key
+    The hash of a query, or None if data was not loaded by core.load_game
+    and so its json is not known.
+    """
+    if getattr(data, 'sources', None) is None:
+        return None
+    query = {'version': QUERY_VERSION, 'game': data.game,
+             'sources': data.sources, 'skills': sorted(set(wanted_skills)),
+             'options': query_options(options)}
+    text = json.dumps(query, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class QueryCache:
+    """QueryCache
+    The results of searches saved in a folder, at most max_bytes of
+    them.
+    """
+
+    def __init__(self, folder, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.pickle')
+
+    def lookup(self, wanted_skills, data, options):
+        """lookup
+        The sets saved for a query, or None if there are none.
+        """
+        key = query_key(wanted_skills, data, options)
+        if key is None:
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                sets = pickle.load(f)
+            os.utime(self.path(key))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return sets
+
+    def store(self, wanted_skills, data, options, sets):
+        """store
+        Saves the sets found for a query, then makes room if the folder
+        is over its size.
+        """
+        key = query_key(wanted_skills, data, options)
+        if key is None:
+            return None
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(key)
+        with open(path + '.new', 'wb') as f:
+            pickle.dump(list(sets), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.new', path)
+        self.evict()
+        return None
+
+    def evict(self):
+        """evict
+        Deletes the least recently used results until the folder is no
+        bigger than max_bytes.
+        """
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.pickle'):
+                info = entry.stat()
+                files.append((info.st_mtime_ns, info.st_size, entry.path))
+        total = sum(x[1] for x in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        return None
+
+    def clear(self):
+        """clear
+        Deletes every saved result.
+        """
+        if os.path.isdir(self.folder):
+            for entry in os.scandir(self.folder):
+                if entry.name.endswith('.pickle'):
+                    os.remove(entry.path)
+        return None
@@ -4,13 +4,19 @@ A simple armour set creator and searcher for Monster Hunter 4U.
 """
 
 
+import functools
 import json
-import time
-import os
 import subprocess
 import threading
 from gi.repository import Gtk, Gdk, GLib
 
+import numpy
+
+import charms
+import core
+import engine
+import model
+
 
 class AsThread:
     def __init__(self, daemon=True):
@@ -43,12 +49,13 @@ class SkillList(Gtk.ScrolledWindow):
     """SkillList
     A list of skills for the user to select from.
     There is a checkbox next to each skill if the user
-    selects it the program will attempt to find it when you click search
+    selects it the program will attempt to find it when you click search.
+    The skills ticked in the Avoid column are never in the results.
     """
 
     def __init__(self):
         Gtk.ScrolledWindow.__init__(self)
-        self.list = Gtk.ListStore(str, bool, str)
+        self.list = Gtk.ListStore(str, bool, str, bool)
         self.view = Gtk.TreeView(self.list)
         self.view.set_activate_on_single_click(True)
         self.view.set_hexpand(True)
@@ -63,8 +70,12 @@ class SkillList(Gtk.ScrolledWindow):
         check_column = Gtk.TreeViewColumn('', check_render, active=1)
         check_column.set_clickable(True)
         check_column.connect('clicked', self.check_column_clicked)
+        avoid_render = Gtk.CellRendererToggle()
+        avoid_render.connect('toggled', self.avoid_toggled)
+        avoid_column = Gtk.TreeViewColumn('Avoid', avoid_render, active=3)
         self.view.append_column(check_column)
         self.view.append_column(text_column)
+        self.view.append_column(avoid_column)
         self.add(self.view)
         self.populate()
 
@@ -75,10 +86,12 @@ class SkillList(Gtk.ScrolledWindow):
         print('Populating skill list.')
         self.list.clear()
         for skill_name in sorted(skills):
-            self.list.append([skill_name, 0, '{} ({} {:+})'.format(skills[
+            self.list.append([skill_name, 0, '{} ({} {:+}){}'.format(skills[
                               skill_name]['Description'],
                               skills[skill_name]['Jewel'],
-                              int(skills[skill_name]['Points']))])
+                              int(skills[skill_name]['Points']),
+                              tree_sources(skills[skill_name]['Jewel'])),
+                              False])
         return None
 
     def clicked(self, view, path, _):
@@ -90,6 +103,15 @@ class SkillList(Gtk.ScrolledWindow):
         self.list[index][1] = not self.list[index][1]
         return None
 
+    def avoid_toggled(self, renderer, path):
+        """avoid_toggled
+        Ticks or unticks a skill the sets must not have.
+        """
+        index = int(path)
+        print('Avoiding skill "{}" toggled.'.format(self.list[index][0]))
+        self.list[index][3] = not self.list[index][3]
+        return None
+
     def check_column_clicked(self, *_):
         """check_column_clicked
         Gets called when you click the title of the check colums,
@@ -98,9 +120,28 @@ class SkillList(Gtk.ScrolledWindow):
         print('Clearing skill list.')
         for item in self.list:
             item[1] = 0
+            item[3] = False
         return True
 
 
+def tree_sources(tree, count=3):
+    """tree_sources
+    A few lines for a tooltip about the jewels and the pieces of each
+    part that give the most points to a tree.
+    """
+    lines = []
+    found = data.jewels_giving(tree)[:count]
+    if found:
+        lines.append('Jewels: ' + ', '.join('{} {:+} ({} slots)'.format(*x)
+                                            for x in found))
+    for part in model.PARTS:
+        found = data.pieces_giving(tree, part)[:count]
+        if found:
+            lines.append('{}: '.format(part) + ', '.join(
+                '{} {:+}'.format(*x) for x in found))
+    return ''.join('\n' + line for line in lines)
+
+
 class SearchButton(Gtk.Button):
     """SearchButton
     The button that starts the searching!
@@ -137,29 +178,90 @@ class SearchButton(Gtk.Button):
         return None
 
 
-class ResultArea(Gtk.ScrolledWindow):
+class StopButton(Gtk.Button):
+    """StopButton
+    The button that cancels the search that is running.
+    """
+
+    def __init__(self):
+        Gtk.Button.__init__(self)
+        self.set_label('Stop')
+        self.connect('clicked', self.clicked)
+        self.set_vexpand(True)
+        self.set_sensitive(False)
+
+    def clicked(self, button):
+        main_window = self.get_toplevel()
+        if main_window.job is not None:
+            print('Stopping search.')
+            main_window.job.cancel()
+        return None
+
+    @idle_call
+    def disable(self):
+        self.set_sensitive(False)
+        return None
+
+    @idle_call
+    def enable(self):
+        self.set_sensitive(True)
+        return None
+
+
+class ResultArea(Gtk.VBox):
     """ResultArea
-    A scrollable area for the results.
+    The results as rows of one list, with the details of the selected
+    row below it. The details and the tooltips are only made for the
+    rows that are selected or hovered, so long lists stay quick.
     """
 
     def __init__(self):
-        Gtk.ScrolledWindow.__init__(self)
+        Gtk.VBox.__init__(self)
         self.set_vexpand(True)
         self.set_hexpand(True)
-        self.items = Gtk.VBox()
+        # The sets shown, the first column of each row is its index here,
+        # and the GameData they were found in.
+        self.sets = []
+        self.data = None
         title = Gtk.Label()
         title.set_markup('<span foreground="#888" '
                          'size="x-large">Results</span>')
         title.set_justify(Gtk.Justification.LEFT)
-        instruction = Gtk.Label()
-        instruction.set_markup('<span size="x-large" foreground="#999">'
+        self.progress = Gtk.Label()
+        self.status = Gtk.Label()
+        self.status.set_markup('<span size="x-large" foreground="#999">'
                                'Please choose one or more skills from the'
                                ' list on the left \nthen press search!'
                                '</span>')
-        instruction.set_halign(Gtk.Align.CENTER)
-        self.items.pack_start(title, 0, 1, 10)
-        self.items.pack_start(instruction, True, True, 10)
-        self.add(self.items)
+        self.status.set_halign(Gtk.Align.CENTER)
+        self.pack_start(title, False, True, 10)
+        self.pack_start(self.progress, False, True, 0)
+        self.pack_start(self.status, False, True, 10)
+
+        # The sets that only differ in their pieces and jewels are rows
+        # under the first of them.
+        self.list = Gtk.TreeStore(int, int, str, int, int, int, str)
+        self.view = Gtk.TreeView(self.list)
+        self.view.set_has_tooltip(True)
+        self.view.connect('query-tooltip', self.tooltip)
+        self.view.connect('row-activated', self.activated)
+        self.view.get_selection().connect('changed', self.selected)
+        text_render = Gtk.CellRendererText()
+        for heading, column in [('#', 1), ('Set', 2), ('Defense', 3),
+                                ('Slots', 4), ('Points', 5)]:
+            view_column = Gtk.TreeViewColumn(heading, text_render,
+                                             text=column, foreground=6)
+            view_column.set_sort_column_id(column)
+            self.view.append_column(view_column)
+        rows = Gtk.ScrolledWindow()
+        rows.set_vexpand(True)
+        rows.add(self.view)
+        self.details = Gtk.ScrolledWindow()
+        self.details.set_vexpand(True)
+        panes = Gtk.VPaned()
+        panes.pack1(rows, True, False)
+        panes.pack2(self.details, True, False)
+        self.pack_start(panes, True, True, 0)
 
     @AsThread()
     def clear(self):
@@ -172,105 +274,184 @@ class ResultArea(Gtk.ScrolledWindow):
     @idle_call
     def remove_items(self):
         print('Clearing result area.')
-        for item in self.items:
-            self.items.remove(item)
-        title = Gtk.Label()
-        title.set_markup('<span foreground="#888" '
-                         'size="x-large">Results</span>')
-        title.set_justify(Gtk.Justification.LEFT)
-        self.items.pack_start(title, 0, 1, 10)
-        self.show_all()
+        self.sets = []
+        self.data = None
+        self.list.clear()
+        self.show_details(None)
+        self.progress.set_text('')
+        self.status.set_text('')
         return None
 
     @idle_call
-    def add_result(self, result):
-        """add_result
-        Adds a result to the result area.
+    def show_sets(self, game_data, sets, groups):
+        """show_sets
+        Swaps the results shown for a new list of sets, used while the
+        search is still going to show the best sets so far. game_data is
+        the GameData the sets were found in, they are not shown if the
+        game has been changed since. groups are the rows of the sets
+        from set_rows, which is slow for many sets so it is called
+        before, off the main thread.
         """
-        self.items.pack_start(result, 0, 1, 10)
-        self.show_all()
+        if game_data is not data:
+            return None
+        self.sets = list(sets)
+        self.data = game_data
+        self.list.clear()
+        self.show_details(None)
+        # Filling the list with the view detached is a lot quicker.
+        self.view.set_model(None)
+        for group in groups:
+            parent = None
+            for values in group:
+                row = self.list.append(parent, values)
+                if parent is None:
+                    parent = row
+        self.view.set_model(self.list)
+        return None
+
+    @idle_call
+    def set_progress(self, text):
+        self.progress.set_text(text)
         return None
 
     @idle_call
     def add_end_of_results(self):
-        end_of_results = Gtk.Label()
-        end_of_results.set_markup('<span size="xx-large" foreground="#888">'
-                                  'End of Results</span>')
-        self.items.pack_start(end_of_results, True, True, 10)
-        self.show_all()
+        self.status.set_markup('<span size="xx-large" foreground="#888">'
+                               'End of Results</span>')
         return None
 
     @idle_call
     def add_search_string(self, string):
-        label = Gtk.Label(string)
-        self.items.pack_start(label, True, True, 10)
+        self.status.set_text(string)
+        return None
+
+    def show_details(self, index):
+        """show_details
+        Shows the Result widget of a set below the list, or nothing if
+        index is None.
+        """
+        for child in self.details.get_children():
+            self.details.remove(child)
+        if index is not None:
+            self.details.add(Result(index + 1, self.sets[index], self.data))
+            self.details.show_all()
+        return None
+
+    def selected(self, selection):
+        rows, found = selection.get_selected()
+        self.show_details(None if found is None else rows[found][0])
+        return None
+
+    def activated(self, view, path, column):
+        """activated
+        Copies the set of a double clicked row to the clipboard.
+        """
+        print('Result {} activated'.format(self.list[path][1]))
+        copy_set(self.data, self.sets[self.list[path][0]])
         return None
 
+    def tooltip(self, view, x, y, keyboard, tooltip):
+        """tooltip
+        Makes the tooltip of the row under the mouse, the pieces with
+        their jewels and the skill points of the set.
+        """
+        found, x, y, rows, path, _ = view.get_tooltip_context(x, y,
+                                                              keyboard)
+        if not found:
+            return False
+        armour_set = self.sets[rows[path][0]]
+        names, jewel_names = self.data.armour_set_names(armour_set)
+        lines = ['{}: {}{}'.format(part, name, ''.join(
+                 '\n\t' + jewel for jewel in jewels)) for part, name, jewels
+                 in zip(model.PARTS, names, jewel_names)]
+        if armour_set.weapon_slots:
+            lines.append('Weapon: {}{}'.format('o' * armour_set.weapon_slots,
+                         ''.join('\n\t' + jewel for jewel in
+                                 jewel_names[5])))
+        if armour_set.charm is not None:
+            lines.append('Charm: {}{}'.format(armour_set.charm.name, ''.join(
+                         '\n\t' + jewel for jewel in jewel_names[6])))
+        points = self.data.armour_set_points(armour_set)
+        lines.append(', '.join('{} {:+}'.format(tree, points[tree]) for tree
+                               in sorted(points, key=points.get,
+                                         reverse=True)))
+        tooltip.set_text('\n'.join(lines))
+        view.set_tooltip_row(tooltip, path)
+        return True
+
+
+def set_rows(data, sets, labels=None):
+    """set_rows
+    The rows of ResultArea's list for sets of the GameData data, in
+    groups with the rows to show under the first one of each. The sets
+    that are the same but for their pieces and jewels are shown as the
+    alternatives of the first of them, see core.collapse_sets. labels
+    are shown for the sets instead of their pieces if they are given,
+    and then every set has its own row.
+    """
+    if not sets:
+        return []
+    pieces = numpy.array([item.pieces for item in sets])
+    defense = data.set_defense(pieces)[1].tolist()
+    slots = [data.armour_set_slots(item) for item in sets]
+    if labels is None:
+        groups = core.collapse_sets(data, sets)
+        labels = [', '.join(data.armour_set_names(item)[0])
+                  for item in sets]
+    else:
+        groups = [[index] for index in range(len(sets))]
+    rows = []
+    for group in groups:
+        rows.append([])
+        for index in group:
+            item = sets[index]
+            label = labels[index]
+            if not rows[-1] and len(group) > 1:
+                label += ' ({} alternatives)'.format(len(group) - 1)
+            rows[-1].append([index, index + 1, label, defense[index],
+                             slots[index], item.points,
+                             points_color(item.points)])
+    return rows
+
+
+def points_color(points):
+    """points_color
+    The color the points of a set are shown in, green for an exact
+    match down to red for a set far past the wanted points.
+    """
+    if points == 0:
+        return '#0F0'
+    elif points > -5:
+        return '#3A0'
+    elif points > -10:
+        return '#AA0'
+    return '#F00'
+
 
 class Result(Gtk.HBox):
     """Result
     A bunch of widgets for each result.
     """
-    def __init__(self, index, armour_set):
+    def __init__(self, index, armour_set, data):
         Gtk.HBox.__init__(self)
         self.index = index
         self.armour_set = armour_set
-        h_piece = armour_set['head']['name']
-        c_piece = armour_set['chest']['name']
-        a_piece = armour_set['arms']['name']
-        w_piece = armour_set['waist']['name']
-        l_piece = armour_set['legs']['name']
-        def_min = 0
-        def_max = 0
-        total_slots = 0
-        for piece in armour_set:
-            if (isinstance(piece, int) or piece
-                    not in ['head', 'chest', 'arms', 'waist', 'legs']):
-                continue
-            name = armour_set[piece]['name']
-            def_min += armour[name]['defense']['min']
-            def_max += armour[name]['defense']['max']
-            total_slots += armour[name]['slots']
-
-        skill_points = {}
-        for piece in armour_set:
-            if isinstance(piece, int):
-                continue
-            if piece not in ['head', 'arms', 'chest', 'legs', 'waist']:
-                continue
-            name = armour_set[piece]['name']
-            for skill in armour[name]['skills']:
-                if skill not in skill_points:
-                    skill_points[skill] = armour[name]['skills'][skill]
-                else:
-                    skill_points[skill] += armour[name]['skills'][skill]
-        jewel_names = []
-        for index, slot in enumerate(armour_set['slots']):
-            jewel_names.append([])
-            for jewel in slot:
-                if jewel == {}:
-                    continue
-                jname = list(jewel.keys())[0]
-                for skill in jewel[jname]['Skills']:
-                    if skill not in skill_points:
-                        skill_points[skill] = 0
-                    skill_points[skill] += jewel[jname]['Skills'][skill]
-                total_slots -= int(jewel[jname]['Slots'])
-                jewel_names[index].append(jname)
+        self.data = data
+        armour = data.armour
+        names, jewel_names = data.armour_set_names(armour_set)
+        h_piece, c_piece, a_piece, w_piece, l_piece = names
+        pieces, _ = data.armour_set_ids(armour_set)
+        def_min, def_max = [int(x[0]) for x in data.set_defense(pieces)]
+        weapon_slots = armour_set.weapon_slots
+        total_slots = data.armour_set_slots(armour_set)
+        skill_points = data.armour_set_points(armour_set)
 
         set_box = Gtk.VBox()
         title = Gtk.Label()
         title.set_halign(Gtk.Align.START)
-        pnts = armour_set['points']
-        if pnts == 0:
-            color = '#0F0'
-        elif pnts > -5:
-            color = '#3A0'
-        elif pnts > -10:
-            color = '#AA0'
-        else:
-            color = '#F00'
-        points = '<span foreground="{}">Points: {}</span>'.format(color, pnts)
+        pnts = armour_set.points
+        points = '<span foreground="{}">Points: {}</span>'.format(
+                 points_color(pnts), pnts)
         title.set_markup('<span size="xx-large" foreground="#999"><a '
                          'href="#">Result {}</a></span> ({})'.format(
                         self.index, points))
@@ -309,6 +490,20 @@ class Result(Gtk.HBox):
                              '\n\t\t\t\t'.join(jewel_names[4])))
         legs_name.set_halign(Gtk.Align.START)
         legs_name.set_tooltip_text(json.dumps(armour[l_piece], indent='\t'))
+        weapon_name = Gtk.Label()
+        if weapon_slots:
+            weapon_name.set_markup('\t<span font-weight="bold">Weapon:</span>'
+                                   '\t{}\n\t\t\t\t{}'.format(
+                                   'o' * weapon_slots,
+                                   '\n\t\t\t\t'.join(jewel_names[5])))
+        weapon_name.set_halign(Gtk.Align.START)
+        charm_name = Gtk.Label()
+        if armour_set.charm is not None:
+            charm_name.set_markup('\t<span font-weight="bold">Charm:</span>'
+                                  '\t{}\n\t\t\t\t{}'.format(
+                                  armour_set.charm.name,
+                                  '\n\t\t\t\t'.join(jewel_names[6])))
+        charm_name.set_halign(Gtk.Align.START)
         defense_title = Gtk.Label()
         defense_title.set_markup('<span font-weight="bold">Defense:</span>')
         defense_title.set_halign(Gtk.Align.START)
@@ -326,6 +521,11 @@ class Result(Gtk.HBox):
         slots.set_markup('<span font-weight="bold">Slots:</span> {}'.format(
                          total_slots))
         slots.set_halign(Gtk.Align.START)
+        active = Gtk.Label()
+        active.set_markup('<span font-weight="bold">Skills:</span> {}'.format(
+                          ', '.join(data.armour_set_skills(armour_set))))
+        active.set_halign(Gtk.Align.START)
+        active.set_line_wrap(True)
         set_box.set_homogeneous(False)
         set_box.pack_start(set_title, True, True, 10)
         set_box.pack_start(head_name, True, True, 0)
@@ -333,10 +533,13 @@ class Result(Gtk.HBox):
         set_box.pack_start(arms_name, True, True, 0)
         set_box.pack_start(waist_name, True, True, 0)
         set_box.pack_start(legs_name, True, True, 0)
+        set_box.pack_start(weapon_name, True, True, 0)
+        set_box.pack_start(charm_name, True, True, 0)
         set_box.pack_start(defense_title, True, True, 10)
         set_box.pack_start(min_defense, True, True, 0)
         set_box.pack_start(max_defense, True, True, 0)
         set_box.pack_start(slots, True, True, 10)
+        set_box.pack_start(active, True, True, 0)
         self.pack_start(set_box, 1, 1, 10)
 
         scroll = Gtk.ScrolledWindow()
@@ -357,74 +560,63 @@ class Result(Gtk.HBox):
 
     def clicked(self, *params):
         """clicked
-        Generates a simple output of the selected output and copies
-        it to your clipboard.
+        Copies the set to your clipboard.
         """
         print('Result {} clicked'.format(self.index))
-        max_defense = 0
-        min_defense = 0
-        skill_points = {}
-        res_points = {}
-        slots = 0
-        output = ''
-        for piece in self.armour_set:
-            if piece in ['head', 'arms', 'legs', 'waist', 'chest']:
-                name = self.armour_set[piece]['name']
-                slots += armour[name]['slots']
-                for skill in armour[name]['skills']:
-                    if skill not in skill_points:
-                        skill_points[skill] = armour[name]['skills'][skill]
-                    else:
-                        skill_points[skill] += armour[name]['skills'][skill]
-                for res in armour[name]['resistance']:
-                    if res not in res_points:
-                        res_points[res] = armour[name]['resistance'][res]
-                    else:
-                        res_points[res] += armour[name]['resistance'][res]
-                max_defense += armour[name]['defense']['max']
-                min_defense += armour[name]['defense']['min']
-        jewel_names = []
-        for index, slot in enumerate(self.armour_set['slots']):
-            jewel_names.append([])
-            for jewel in slot:
-                if jewel == {}:
-                    continue
-                jname = list(jewel.keys())[0]
-                for skill in jewel[jname]['Skills']:
-                    if skill not in skill_points:
-                        skill_points[skill] = 0
-                    skill_points[skill] += jewel[jname]['Skills'][skill]
-                slots -= int(jewel[jname]['Slots'])
-                jewel_names[index].append(jname)
-        output += 'Armour:\n'
-        output += '\tHead: {}\n\t\t\t\t{}\n'.format(self.armour_set['head']['name'],
-                  '\n\t\t\t\t'.join(jewel_names[0]))
-        output += '\tChest: {}\n\t\t\t\t{}\n'.format(self.armour_set['chest']['name'],
-                  '\n\t\t\t\t'.join(jewel_names[1]))
-        output += '\tWaist: {}\n\t\t\t\t{}\n'.format(self.armour_set['waist']['name'],
-                  '\n\t\t\t\t'.join(jewel_names[2]))
-        output += '\tArms: {}\n\t\t\t\t{}\n'.format(self.armour_set['arms']['name'],
-                  '\n\t\t\t\t'.join(jewel_names[3]))
-        output += '\tLegs: {}\n\t\t\t\t{}\n'.format(self.armour_set['legs']['name'],
-                  '\n\t\t\t\t'.join(jewel_names[4]))
-        output += '\n'
-        output += 'Defense:\n'
-        output += '\tMinimum: {}\n'.format(min_defense)
-        output += '\tMaximum: {}\n\n'.format(max_defense)
-        output += 'Slots: {} ({})\n\n'.format('o' * slots, slots)
-        output += 'Skills:\n\t'
-        output += '\n\t'.join('{}: {}'.format(x, skill_points[x]) for x in
-                              skill_points)
-        output += '\n\n'
-        output += 'Resistances:\n\t'
-        output += '\n\t'.join('{}: {}'.format(x, res_points[x]) for x in
-                              res_points)
-        subprocess.Popen(['clipit', output])
-        subprocess.Popen(['notify-send', 'Armour Set Searcher', 'The armour '
-                          'set is now in your clipboard.'])
+        copy_set(self.data, self.armour_set)
         return True
 
 
+def copy_set(data, armour_set):
+    """copy_set
+    Generates a simple output of an armour set of the GameData data and
+    copies it to your clipboard.
+    """
+    output = ''
+    pieces, _ = data.armour_set_ids(armour_set)
+    min_defense, max_defense = [int(x[0]) for x in
+                                data.set_defense(pieces)]
+    weapon_slots = armour_set.weapon_slots
+    slots = data.armour_set_slots(armour_set)
+    skill_points = data.armour_set_points(armour_set)
+    res_points = dict(zip(model.RESISTANCES,
+                          data.set_resistance(pieces)[0].tolist()))
+    names, jewel_names = data.armour_set_names(armour_set)
+    output += 'Armour:\n'
+    output += '\tHead: {}\n\t\t\t\t{}\n'.format(names[0],
+              '\n\t\t\t\t'.join(jewel_names[0]))
+    output += '\tChest: {}\n\t\t\t\t{}\n'.format(names[1],
+              '\n\t\t\t\t'.join(jewel_names[1]))
+    output += '\tWaist: {}\n\t\t\t\t{}\n'.format(names[3],
+              '\n\t\t\t\t'.join(jewel_names[3]))
+    output += '\tArms: {}\n\t\t\t\t{}\n'.format(names[2],
+              '\n\t\t\t\t'.join(jewel_names[2]))
+    output += '\tLegs: {}\n\t\t\t\t{}\n'.format(names[4],
+              '\n\t\t\t\t'.join(jewel_names[4]))
+    if weapon_slots:
+        output += '\tWeapon: {}\n\t\t\t\t{}\n'.format(
+                  'o' * weapon_slots, '\n\t\t\t\t'.join(jewel_names[5]))
+    if armour_set.charm is not None:
+        output += '\tCharm: {}\n\t\t\t\t{}\n'.format(
+                  armour_set.charm.name, '\n\t\t\t\t'.join(jewel_names[6]))
+    output += '\n'
+    output += 'Defense:\n'
+    output += '\tMinimum: {}\n'.format(min_defense)
+    output += '\tMaximum: {}\n\n'.format(max_defense)
+    output += 'Slots: {} ({})\n\n'.format('o' * slots, slots)
+    output += 'Skills:\n\t'
+    output += '\n\t'.join('{}: {}'.format(x, skill_points[x]) for x in
+                          skill_points)
+    output += '\n\n'
+    output += 'Resistances:\n\t'
+    output += '\n\t'.join('{}: {}'.format(x, res_points[x]) for x in
+                          res_points)
+    subprocess.Popen(['clipit', output])
+    subprocess.Popen(['notify-send', 'Armour Set Searcher', 'The armour '
+                      'set is now in your clipboard.'])
+    return None
+
+
 class SortType(Gtk.HBox):
     """SortType
     A widget for the type of sorting for the program.
@@ -508,6 +700,25 @@ class MinRarity(Gtk.HBox):
         self.pack_start(self.combo, True, True, 10)
 
 
+class WeaponSlots(Gtk.HBox):
+
+    def __init__(self):
+        Gtk.HBox.__init__(self)
+        title = Gtk.Label('Weapon Slots:')
+        title.set_halign(Gtk.Align.START)
+        self.set_homogeneous(True)
+        self.pack_start(title, True, True, 10)
+        self.list = Gtk.ListStore(str)
+        for i in range(0, 4):
+            self.list.append([str(i)])
+        text_render = Gtk.CellRendererText()
+        self.combo = Gtk.ComboBox.new_with_model(self.list)
+        self.combo.pack_start(text_render, True)
+        self.combo.add_attribute(text_render, "text", 0)
+        self.combo.set_active(0)
+        self.pack_start(self.combo, True, True, 10)
+
+
 class MaxRarity(Gtk.HBox):
 
     def __init__(self):
@@ -527,16 +738,11 @@ class MaxRarity(Gtk.HBox):
         self.pack_start(self.combo, True, True, 10)
 
 
-class JewelsCount(Gtk.CheckButton):
-    def __init__(self):
-        Gtk.CheckButton.__init__(self, 'Jewels count as another set')
-
-
 class Game(Gtk.ComboBox):
     def __init__(self):
         Gtk.ComboBox.__init__(self)
         self.list = Gtk.ListStore(str)
-        games = os.listdir('data/')
+        games = core.games()
         for i in games:
             self.list.append([i])
         text_render = Gtk.CellRendererText()
@@ -549,33 +755,25 @@ class Game(Gtk.ComboBox):
         self.connect('changed', self.clicked)
 
     def clicked(self, widget):
-        global game, armour, head_parts, arm_parts, chest_parts, waist_parts, leg_parts, jewels, skills
+        global game, armour, head_parts, arm_parts, chest_parts, waist_parts, leg_parts, jewels, skills, data
         index = self.get_active()
         game = self.list[index][0]
 
-        with open('use_game.txt', 'w') as f:
-            f.write(game)
+        if game != core.default_game():
+            with open(core.GAME_FILE, 'w') as f:
+                f.write(game)
 
-        # Opens all the files and load in the data once.
-        with open('data/{}/armour.json'.format(game), 'r') as fp:
-            armour = json.loads(fp.read())
-        with open('data/{}/jewels.json'.format(game), 'r') as fp:
-            jewels = json.loads(fp.read())
-        with open('data/{}/skills.json'.format(game), 'r') as fp:
-            skills = json.loads(fp.read())
+        # Each game is only loaded once.
+        data = core.load_game(game)
+        armour, jewels, skills = data.armour, data.jewels, data.skills
 
 
-        # Parse through all the armour pieces and sort them to their part.
-        head_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                            == 'Head'}, key=piece_sort)
-        arm_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                            == 'Arms'}, key=piece_sort)
-        chest_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                            == 'Chest'}, key=piece_sort)
-        leg_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                            == 'Legs'}, key=piece_sort)
-        waist_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                            == 'Waist'}, key=piece_sort)
+        # The pieces of each part were sorted when the game was compiled.
+        head_parts = data.part_lists['Head']
+        arm_parts = data.part_lists['Arms']
+        chest_parts = data.part_lists['Chest']
+        leg_parts = data.part_lists['Legs']
+        waist_parts = data.part_lists['Waist']
 
 
         print('Loaded {} armour pieces in total.'.format(len(armour)))
@@ -586,6 +784,10 @@ class Game(Gtk.ComboBox):
         print('Loaded {} waist pieces.'.format(len(waist_parts)))
 
         main_window = self.get_toplevel()
+        # The results and a search still running are of the old game.
+        if main_window.job is not None:
+            main_window.job.cancel()
+        main_window.result_area.clear()
         main_window.skill_list.populate()
         main_window.base.update_list()
         return None
@@ -594,12 +796,90 @@ class Game(Gtk.ComboBox):
 class ResultLimit(Gtk.HBox):
     def __init__(self):
         Gtk.HBox.__init__(self)
-        title = Gtk.Label('Amount of sets:')
-        self.set_tooltip_text('This does not affect the amount of results'
-                               ' that are returned.')
+        title = Gtk.Label('Amount of results:')
+        self.set_tooltip_text('The amount of the best sets that are '
+                              'returned.')
         self.pack_start(title, True, True, 10)
         self.edit = Gtk.Entry()
-        self.edit.set_text('400000')
+        self.edit.set_text('100')
+        self.edit.connect('changed', self.new_text)
+        self.pack_start(self.edit, True, True, 10)
+
+    def new_text(self, *args):
+        text = self.edit.get_text().strip()
+        self.edit.set_text(''.join([x for x in text if x in '1234567890']))
+
+
+class Minimums(Gtk.HBox):
+    """Minimums
+    The least max defense, free slots and resistances the sets must
+    have, 0 for the resistances leaves them out.
+    """
+
+    def __init__(self):
+        Gtk.HBox.__init__(self)
+        self.set_tooltip_text('Sets without at least these are never '
+                              'searched.')
+        self.defense = self.spin('Min Defense:', 0, 2000)
+        self.slots = self.spin('Min Slots:', 0, 21)
+        self.resistances = {}
+        for element in model.RESISTANCES:
+            self.resistances[element] = self.spin(element + ':', -50, 50)
+
+    def spin(self, text, lowest, highest):
+        title = Gtk.Label(text)
+        button = Gtk.SpinButton.new_with_range(lowest, highest, 1)
+        button.set_value(0)
+        self.pack_start(title, False, True, 5)
+        self.pack_start(button, False, True, 5)
+        return button
+
+    def options(self):
+        """options
+        The minimums as search_sets options.
+        """
+        return {'min_defense': self.defense.get_value_as_int(),
+                'min_slots': self.slots.get_value_as_int(),
+                'min_resistance': {element: button.get_value_as_int()
+                                   for element, button in
+                                   self.resistances.items()
+                                   if button.get_value_as_int()}}
+
+
+class Charms(Gtk.HBox):
+    """Charms
+    The file of the charms the player has, see charms.py. Searches use
+    them if one is chosen.
+    """
+
+    def __init__(self):
+        Gtk.HBox.__init__(self)
+        title = Gtk.Label('Charms:')
+        self.set_tooltip_text('A json or csv file of your charms, each set '
+                              'gets the best one of them.')
+        self.pack_start(title, True, True, 10)
+        self.chooser = Gtk.FileChooserButton(title='Charms')
+        self.pack_start(self.chooser, True, True, 10)
+
+    def inventory(self):
+        """inventory
+        The charms in the chosen file, or None if there is none.
+        """
+        path = self.chooser.get_filename()
+        if path is None:
+            return None
+        return charms.load_charms(path)
+
+
+class Workers(Gtk.HBox):
+    def __init__(self):
+        Gtk.HBox.__init__(self)
+        title = Gtk.Label('Workers:')
+        self.set_tooltip_text('The amount of processes the search is split '
+                              'over, one per core is best.')
+        self.pack_start(title, True, True, 10)
+        self.edit = Gtk.Entry()
+        self.edit.set_text('1')
         self.edit.connect('changed', self.new_text)
         self.pack_start(self.edit, True, True, 10)
 
@@ -679,7 +959,8 @@ class BaseOff(Gtk.Button):
         cancel.connect('clicked', self.window.destroy)
         self.search = Gtk.Button('Generate possible skills')
         self.search.set_tooltip_text('This will generate a list of all '
-                                     'possible skills for this armor set.')
+                                     'the skills this armor set can also '
+                                     'have on top of the chosen ones.')
         self.search.connect('clicked', self.skills_search)
         grid.attach(self.head_pieces, 0, 0, 5, 10)
         grid.attach(self.chest_pieces, 5, 0, 5, 10)
@@ -687,6 +968,8 @@ class BaseOff(Gtk.Button):
         grid.attach(self.waist_pieces, 15, 0, 5, 10)
         grid.attach(self.leg_pieces, 20, 0, 5, 10)
         grid.attach(okay, 0, 10, 1, 1)
+        grid.attach(self.search, 1, 10, 1, 1)
+        self.check_pieces()
         self.window.add(grid)
 
     def clicked(self, *args):
@@ -740,10 +1023,10 @@ class BaseOff(Gtk.Button):
         legs = [x[0] for x in self.leg_pieces.list if x[1]]
         if (len(head) == 1 and len(chest) == 1 and len(arms) == 1
                 and len(waist) == 1 and len(legs) == 1):
-            #self.search.show()
+            self.search.set_sensitive(True)
             return True
         else:
-            #self.search.hide()
+            self.search.set_sensitive(False)
             return False
 
     def okay(self, *args):
@@ -764,18 +1047,31 @@ class BaseOff(Gtk.Button):
         main_window.result_area.clear()
         main_window.search_button.disable()
         wanted_skills = [x[0] for x in main_window.skill_list.list if x[1] == True]
-        head = [x[0] for x in self.head_pieces.list if x[1]][0]
-        chest = [x[0] for x in self.chest_pieces.list if x[1]][0]
-        arms = [x[0] for x in self.arm_pieces.list if x[1]][0]
-        waist = [x[0] for x in self.waist_pieces.list if x[1]][0]
-        legs = [x[0] for x in self.leg_pieces.list if x[1]][0]
-        sets = generate_skills(wanted_skills, head, chest, arms, waist, legs)
-        sorted_sets = sorted(sets, key=skill_sort)
-        for index, item in enumerate(sorted_sets[:100]):
-            result = Result(index+1, item)
-            main_window.result_area.add_result(result)
+        names = [[x[0] for x in pieces.list if x[1]][0] for pieces in
+                 [self.head_pieces, self.chest_pieces, self.arm_pieces,
+                  self.waist_pieces, self.leg_pieces]]
+        weapon_slots = int(main_window.weapon_slots.list[
+            main_window.weapon_slots.combo.get_active()][0])
+        avoid = [x[0] for x in main_window.skill_list.list if x[3]]
+        # The game can be changed while this runs.
+        game_data = data
+        try:
+            found = core.set_skills(game_data, names, weapon_slots,
+                                    wanted_skills, avoid,
+                                    inventory=main_window.charms.inventory())
+        except (OSError, ValueError) as error:
+            main_window.result_area.add_search_string(str(error))
+            main_window.search_button.enable()
+            return None
+        if found is None:
+            main_window.result_area.add_search_string(
+                'These pieces cannot have all the chosen skills.')
+        else:
+            sets = [x[1] for x in found]
+            main_window.result_area.show_sets(game_data, sets, set_rows(
+                game_data, sets, [x[0] for x in found]))
+            main_window.result_area.add_end_of_results()
         main_window.search_button.enable()
-        main_window.result_area.add_end_of_results()
         return None
 
 
@@ -786,6 +1082,10 @@ class MainWindow(Gtk.Window):
     def __init__(self):
         Gtk.Window.__init__(self)
 
+        # The search that is running or ran last.
+        self.job = None
+        # Keeps the pruning of one search for the next, for one game.
+        self.session = None
         self.connect('delete-event', Gtk.main_quit)
         self.create_widgets()
         self.show_all()
@@ -801,6 +1101,7 @@ class MainWindow(Gtk.Window):
         self.grid.set_column_spacing(10)
         self.skill_list = SkillList()
         self.search_button = SearchButton()
+        self.stop_button = StopButton()
         self.result_area = ResultArea()
         self.separator = Gtk.Separator()
         self.sort_type = SortType()
@@ -808,15 +1109,19 @@ class MainWindow(Gtk.Window):
         self.weapon = Weapon()
         self.min_rarity = MinRarity()
         self.max_rarity = MaxRarity()
-        self.jewels_count = JewelsCount()
+        self.weapon_slots = WeaponSlots()
         self.game = Game()
         self.limit = ResultLimit()
+        self.workers = Workers()
+        self.charms = Charms()
+        self.minimums = Minimums()
         self.base = BaseOff({'head': head_parts, 'chest': chest_parts,
                              'legs': leg_parts, 'waist': waist_parts,
                              'arms': arm_parts})
         self.grid.attach(self.game, 0, 0, 7, 1)
         self.grid.attach(self.skill_list, 0, 1, 7, 19)
-        self.grid.attach(self.search_button, 0, 20, 7, 1)
+        self.grid.attach(self.search_button, 0, 20, 5, 1)
+        self.grid.attach(self.stop_button, 5, 20, 2, 1)
         self.grid.attach(self.separator, 7, 17, 17, 1)
         self.grid.attach(self.result_area, 7, 1, 17, 16)
         self.grid.attach(self.sort_type, 7, 18, 8, 1)
@@ -824,488 +1129,98 @@ class MainWindow(Gtk.Window):
         self.grid.attach(self.weapon, 7, 19, 8, 1)
         self.grid.attach(self.min_rarity, 15, 18, 9, 1)
         self.grid.attach(self.max_rarity, 15, 19, 9, 1)
-        self.grid.attach(self.jewels_count, 15, 20, 7, 1)
+        self.grid.attach(self.weapon_slots, 15, 20, 8, 1)
         self.grid.attach(self.limit, 17, 0, 7, 1)
+        self.grid.attach(self.workers, 10, 0, 7, 1)
+        self.grid.attach(self.charms, 7, 21, 8, 1)
+        self.grid.attach(self.minimums, 7, 22, 17, 1)
         self.grid.attach(self.base, 23, 20, 1, 1)
         self.add(self.grid)
         return None
 
-    @AsThread()
+    def progress(self, game_data, sets, stats):
+        """progress
+        Shows the best sets so far and how far the search has got, the
+        engine calls this a few times a second on the job's thread, where
+        the rows of the sets are worked out too. game_data is the
+        GameData the job searches.
+        """
+        if sets is not None:
+            self.result_area.show_sets(game_data, sets,
+                                       set_rows(game_data, sets))
+        self.result_area.set_progress(stats.text())
+        return None
+
     def search(self):
         """search
-        Initiates the search for the program.
+        Initiates the search for the program. A search that is still
+        running is cancelled and this one takes over.
         """
         self.result_area.clear()
-        self.search_button.disable()
 
         wanted_skills = [x[0] for x in self.skill_list.list if x[1] == True]
+        avoid = [x[0] for x in self.skill_list.list if x[3]]
         sort_type = self.sort_type.list[self.sort_type.combo.get_active()][0]
         gender = self.gender.list[self.gender.combo.get_active()][0]
         weapon = self.weapon.list[self.weapon.combo.get_active()][0]
-        jewels_count = self.jewels_count.get_active()
-        amount = int(self.limit.edit.get_text())
-        use_pieces = self.base.data
+        amount = int(self.limit.edit.get_text() or 0)
+        workers = int(self.workers.edit.get_text() or 1)
+        weapon_slots = int(self.weapon_slots.list[
+            self.weapon_slots.combo.get_active()][0])
         min_rarity = int(self.min_rarity.list[
             self.min_rarity.combo.get_active()][0])
         max_rarity = int(self.max_rarity.list[
             self.max_rarity.combo.get_active()][0])
+        use_pieces = core.rarity_parts(data, min_rarity, max_rarity,
+                                       self.base.data)
+        try:
+            inventory = self.charms.inventory()
+            if inventory:
+                charms.charm_skills(data, inventory)
+        except (OSError, ValueError) as error:
+            self.result_area.add_search_string(str(error))
+            return None
         self.result_area.add_search_string('Searching for {}.'.format(
                                            ', '.join(wanted_skills)))
 
-        try:
-            results = generate_combos(wanted_skills, armour, skills, jewels,
-                             gender, weapon, gems_count=jewels_count,
-                            size_limit=amount, use_parts=use_pieces)
-            sorter = ArmourSort(wanted_skills, sort_type=sort_type)
-            print('Sorting, please wait.')
-            sorted_results = sorted(results, key=sorter.sort, reverse=True)
-        except Exception:
-            raise
-        else:
-            print('Showing results.')
-            for index, item in enumerate(sorted_results[:100]):
-                result = Result(index+1, item)
-                self.result_area.add_result(result)
-
-        print('Done.')
-        self.search_button.enable()
-        self.result_area.add_end_of_results()
+        if self.session is None or self.session.data is not data:
+            self.session = engine.SearchSession(data)
+        previous = self.job
+        self.job = engine.SearchJob(wanted_skills, data,
+                                    functools.partial(self.progress, data),
+                                    self.search_finished, core.queries,
+                                    self.session, gender=gender,
+                                    weapon=weapon, sort_type=sort_type,
+                                    limit=amount, use_parts=use_pieces,
+                                    workers=workers,
+                                    weapon_slots=weapon_slots, avoid=avoid,
+                                    inventory=inventory,
+                                    **self.minimums.options())
+        self.job.start(previous)
+        self.stop_button.enable()
         return None
 
-
-class ArmourSort:
-    def __init__(self, wanted_skills, sort_type='Default'):
-        self.wanted_skills = {}
-        for name in wanted_skills:
-            self.wanted_skills[name] = skills[name]['Points']
-        self.sort_type = sort_type
-
-    def sort(self, aset):
-        head = aset['head']
-        chest = aset['chest']
-        arms = aset['arms']
-        waist = aset['waist']
-        legs = aset['legs']
-        hjl = []
-        cjl = []
-        ajl = []
-        wjl = []
-        ljl = []
-        for item in aset['slots'][0]:
-            if item == {}:
-                continue
-            hjl.append(item[list(item.keys())[0]])
-        for item in aset['slots'][1]:
-            if item == {}:
-                continue
-            cjl.append(item[list(item.keys())[0]])
-        for item in aset['slots'][2]:
-            if item == {}:
-                continue
-            ajl.append(item[list(item.keys())[0]])
-        for item in aset['slots'][3]:
-            if item == {}:
-                continue
-            wjl.append(item[list(item.keys())[0]])
-        for item in aset['slots'][4]:
-            if item == {}:
-                continue
-            ljl.append(item[list(item.keys())[0]])
-
-        total_points = 0
-        for skill in self.wanted_skills:
-            skill_points = self.wanted_skills[skill]
-            name = skills[skill]['Jewel']
-            torso_up = ('Torso Up' in head['skills'] or
-                       'Torso Up' in chest['skills'] or
-                       'Torso Up' in arms['skills'] or
-                       'Torso Up' in waist['skills'] or
-                       'Torso Up' in legs['skills'])
-            if torso_up:
-                for skill in chest['skills']:
-                    chest['skill'][name] = chest['skill'][name] * 2
-                points += 100
-            points = 0
-            if name in head['skills']:
-                sp = int(head['skills'][name])
-                points += sp
-            if name in chest['skills']:
-                sp = int(chest['skills'][name])
-                if torso_up:
-                    sp = sp * 2
-                points += sp
-            if name in arms['skills']:
-                sp = int(arms['skills'][name])
-                points += sp
-            if name in waist['skills']:
-                sp = int(waist['skills'][name])
-                points += sp
-            if name in legs['skills']:
-                sp = int(legs['skills'][name])
-                points += sp
-            for hj in hjl:
-                if hj is not None and name in hj['Skills']:
-                    sp =  int(hj['Skills'][name])
-                    points += sp
-            for cj in cjl:
-                if cj is not None and name in cj['Skills']:
-                    sp =  int(cj['Skills'][name])
-                    points += sp
-            for aj in ajl:
-                if aj is not None and name in aj['Skills']:
-                    sp =  int(aj['Skills'][name])
-                    points += sp
-            for wj in wjl:
-                if wj is not None and name in wj['Skills']:
-                    sp =  int(wj['Skills'][name])
-                    points += sp
-            for lj in ljl:
-                if lj is not None and name in lj['Skills']:
-                    sp =  int(lj['Skills'][name])
-                    points += sp
-            total_points -= ((int(skill_points)-points if int(skill_points)
-                              > points else points-int(skill_points)))
-        aset['points'] = total_points
-        if self.sort_type == 'Defense':
-            defense = (head['defense']['max'] + arms['defense']['max']
-                       + chest['defense']['max'] + waist['defense']['max']
-                       + legs['defense']['max'])
-            total_points -= (10000-(defense/10000))
-        if self.sort_type == 'Slots':
-            slots = (head['slots'] + arms['slots'] + chest['slots']
-                     + waist['slots'] + legs['slots'])
-            total_points -= (100-(slots/100))
-        return total_points
-
-
-class PieceSort:
-    def __init__(self, wanted_skills, sort_type='Default'):
-        self.wanted_skills = {}
-        for name in wanted_skills:
-            self.wanted_skills[name] = skills[name]['Points']
-        self.sort_type = sort_type
-
-    def sort(self, aset):
-        total = 0
-        for skill in aset['skills']:
-            if skill in self.wanted_skills:
-                total += aset['skills'][skill]
-        return total
-
-
-def jewel_name(item):
-    return list(item.keys())[0]
-
-
-def skill_sort(aset):
-    head = aset['head']
-    chest = aset['chest']
-    legs = aset['legs']
-    arms = aset['arms']
-    waist = aset['waist']
-    skill_points = {}
-    for item in [head, chest, arms, waist, legs]:
-        for skill in item['skills']:
-            if skill not in skill_points:
-                 skill_points[skill] = 0
-            skill_points[skill] += item['skills'][skill]
-    for item in aset['slots']:
-        for jewel in item:
-            if 'Skills' not in jewel:
-                continue
-            name = list(jewel.keys())[0]
-            for skill in jewel[name]['Skills']:
-                if skill not in skill_points:
-                     skill_points[skill] = 0
-                skill_points[skill] += jewel[name]['Skills'][skill]
-    total_points = 0
-    for skill in skill_points:
-        total_points += skill_points[skill]
-    aset['points'] = total_points
-    return total_points/10
-
-
-def generate_skills(wanted_skills, head, chest, arms, waist, legs):
-    hc = armour[head]
-    cc = armour[chest]
-    ac = armour[arms]
-    wc = armour[waist]
-    lc = armour[legs]
-    hc['name'] = head
-    cc['name'] = chest
-    ac['name'] = arms
-    wc['name'] = waist
-    lc['name'] = legs
-    required_skills = {}
-
-    for skill_name in wanted_skills:
-        if skill_name in skills:
-            required_skills[skill_name] = skills[skill_name]
-
-    hji = cji = aji = wji = lji = 0
-    jls = [{'No Jewel': {'Points': 0, 'Slots': 0}}]
-    for item in sorted(jewels, reverse=True, key=jewel_name):
-        name = list(item.keys())[0]
-        if (not any(required_skills[x]['Jewel'] in item[name]['Skills']
-                for x in required_skills)):
-                    continue
-        jls.append(item)
-    index = 0
-    while True:
-        hjn = list(jls[hji].keys())[0]
-        cjn = list(jls[cji].keys())[0]
-        ajn = list(jls[aji].keys())[0]
-        wjn = list(jls[wji].keys())[0]
-        ljn = list(jls[lji].keys())[0]
-        if hji == 0:
-            hj = [{}]
-        else:
-            hj = [jls[hji]] * (int(hc['slots']) // int(jls[hji][hjn]['Slots']))
-        if cji == 0:
-            cj = [{}]
-        else:
-            cj = [jls[cji]] * (int(cc['slots']) // int(jls[cji][cjn]['Slots']))
-        if aji == 0:
-            aj = [{}]
-        else:
-            aj = [jls[aji]] * (int(ac['slots']) // int(jls[aji][ajn]['Slots']))
-        if wji == 0:
-            wj = [{}]
-        else:
-            wj = [jls[wji]] * (int(wc['slots']) // int(jls[wji][wjn]['Slots']))
-        if lji == 0:
-            lj = [{}]
-        else:
-            lj = [jls[lji]] * (int(lc['slots']) // int(jls[lji][ljn]['Slots']))
-        yield {'head': hc, 'chest': cc, 'arms': ac, 'waist': wc, 'legs': lc,
-               'slots': [hj, cj, aj, wj, lj]}
-        hji += 1
-        index += 1
-        if (index+1) % 100000 == 0:
-            time.sleep(1)
-        if hji == len(jls):
-            hji = 0
-            cji += 1
-        if cji == len(jls):
-            cji = 0
-            aji += 1
-        if aji == len(jls):
-            aji = 0
-            wji += 1
-        if wji == len(jls):
-            wji = 0
-            lji += 1
-        if lji == len(jls) or index == 5000000:
-            break
-    raise StopIteration
-
-
-def generate_combos(wanted_skills, armour, skills, jewels, gender, weapon,
-                    only_skilled=True, gems_count=False, size_limit=1000000,
-                    use_parts={}):
-    sets = []
-    head = []
-    arms = []
-    chest = []
-    waist = []
-    legs = []
-    jls = [{'No Jewel': {'Points': 0, 'Slots': 0}}]
-    required_skills = {}
-
-    if (use_parts['head'] != head_parts or use_parts['chest'] != chest_parts
-            or use_parts['waist'] != waist_parts
-            or use_parts['legs'] != leg_parts):
-        only_skilled = False
-
-    for skill_name in wanted_skills:
-        if skill_name in skills:
-            required_skills[skill_name] = skills[skill_name]
-
-    for name in use_parts['head']:
-        item = armour[name]
-        item['name'] = name
-        if (only_skilled and (not any(required_skills[x]['Jewel'] in
-                item['skills'] for x in required_skills) or 'Torso Up' in
-                item['skills'])):
-            continue
-        if ((weapon == item['type'] or item['type'] == 'Both' or
-                weapon == 'Both') and (gender == item['gender'] or
-                gender == 'Both' or item['gender'] == 'Both')):
-            head.append(item)
-
-    sorter = PieceSort(required_skills)
-    head = sorted(head, key=sorter.sort)
-
-    for name in use_parts['chest']:
-        item = armour[name]
-        item['name'] = name
-        if only_skilled and (not any(required_skills[x]['Jewel'] in
-                item['skills']
-                for x in required_skills) or 'Torso Up' in item['skills']):
-            continue
-        if ((weapon == item['type'] or item['type'] == 'Both' or
-                weapon == 'Both') and (gender == item['gender'] or
-                gender == 'Both' or item['gender'] == 'Both')):
-            chest.append(item)
-
-    sorter = PieceSort(required_skills)
-    chest = sorted(chest, key=sorter.sort)
-
-    for name in use_parts['arms']:
-        item = armour[name]
-        item['name'] = name
-        if only_skilled and (not any(required_skills[x]['Jewel'] in
-                item['skills']
-                for x in required_skills) or 'Torso Up' in item['skills']):
-            continue
-        if ((weapon == item['type'] or item['type'] == 'Both' or
-                weapon == 'Both') and (gender == item['gender'] or
-                gender == 'Both' or item['gender'] == 'Both')):
-            arms.append(item)
-
-    sorter = PieceSort(required_skills)
-    arms = sorted(arms, key=sorter.sort)
-
-    for name in use_parts['waist']:
-        item = armour[name]
-        item['name'] = name
-        if only_skilled and (not any(required_skills[x]['Jewel'] in
-                item['skills']
-                for x in required_skills) or 'Torso Up' in item['skills']):
-            continue
-        if ((weapon == item['type'] or item['type'] == 'Both' or
-                weapon == 'Both') and (gender == item['gender'] or
-                gender == 'Both' or item['gender'] == 'Both')):
-            waist.append(item)
-
-    sorter = PieceSort(required_skills)
-    waist = sorted(waist, key=sorter.sort)
-
-    for name in use_parts['legs']:
-        item = armour[name]
-        item['name'] = name
-        if only_skilled and (not any(required_skills[x]['Jewel'] in
-                item['skills']
-                for x in required_skills) or 'Torso Up' in item['skills']):
-            continue
-        if ((weapon == item['type'] or item['type'] == 'Both' or
-                weapon == 'Both') and (gender == item['gender'] or
-                gender == 'Both' or item['gender'] == 'Both')):
-            legs.append(item)
-
-    sorter = PieceSort(required_skills)
-    legs = sorted(legs, key=sorter.sort)
-
-    for item in sorted(jewels, reverse=True, key=jewel_name):
-        name = list(item.keys())[0]
-        if (not any(required_skills[x]['Jewel'] in item[name]['Skills']
-                for x in required_skills)):
-                    continue
-        cn = 0
-        for skill in required_skills:
-            sname = required_skills[skill]['Jewel']
-            if (sname in item[name]['Skills']
-                    and int(required_skills[skill]['Points']) > 0
-                    and int(item[name]['Skills'][sname]) < 0):
-                cn += 1
-        if cn != len(required_skills):
-            jls.append(item)
-
-    hi = ci = ai = wi = li = hji = cji = aji = wji = lji = 0
-    index = 0
-    while True:
-        if (len(head) == 0 or len(chest) == 0 or len(arms) == 0 or
-                len(waist) == 0 or len(legs) == 0):
-            raise StopIteration
-        hc = head[hi]
-        cc = chest[ci]
-        ac = arms[ai]
-        wc = waist[wi]
-        lc = legs[li]
-        if hji > len(jls):
-            hji = len(jls)-1
-        if cji > len(jls):
-            cji = len(jls)-1
-        if aji > len(jls):
-            aji = len(jls)-1
-        if wji > len(jls):
-            wji = len(jls)-1
-        if lji > len(jls):
-            lji = len(jls)-1
-
-        hjn = list(jls[hji].keys())[0]
-        cjn = list(jls[cji].keys())[0]
-        ajn = list(jls[aji].keys())[0]
-        wjn = list(jls[wji].keys())[0]
-        ljn = list(jls[lji].keys())[0]
-
-        if hji == 0:
-            hj = [{}]
-        else:
-            hj = [jls[hji]] * (int(hc['slots']) // int(jls[hji][hjn]['Slots']))
-        if cji == 0:
-            cj = [{}]
-        else:
-            cj = [jls[cji]] * (int(cc['slots']) // int(jls[cji][cjn]['Slots']))
-        if aji == 0:
-            aj = [{}]
-        else:
-            aj = [jls[aji]] * (int(ac['slots']) // int(jls[aji][ajn]['Slots']))
-        if wji == 0:
-            wj = [{}]
-        else:
-            wj = [jls[wji]] * (int(wc['slots']) // int(jls[wji][wjn]['Slots']))
-        if lji == 0:
-            lj = [{}]
-        else:
-            lj = [jls[lji]] * (int(lc['slots']) // int(jls[lji][ljn]['Slots']))
-        yield {'head': hc, 'chest': cc, 'arms': ac, 'waist': wc, 'legs': lc,
-               'slots': [hj, cj, aj, wj, lj]}
-
-        if hji == 0:
-            hji += 1
-            cji += 1
-            aji += 1
-            wji += 1
-            lji += 1
+    def search_finished(self, job):
+        """search_finished
+        Called on the job's thread when a search ends. Searches that
+        another one took over from are left alone.
+        """
+        if job is not self.job:
+            return None
+        self.stop_button.disable()
+        if job.stats is not None:
+            print(job.stats.text())
+        if job.state == 'done':
+            print('Found {} results.'.format(len(job.results)))
+            self.result_area.add_end_of_results()
+        elif job.state == 'cancelled':
+            print('Search stopped.')
+            self.result_area.add_search_string('Search stopped.')
         else:
-            hji += 1
-        if hji == len(jls):
-            hji = 0
-            cji += 1
-        if cji == len(jls):
-            cji = 0
-            aji += 1
-        if aji == len(jls):
-            aji = 0
-            wji += 1
-        if wji == len(jls):
-            wji = 0
-            lji += 1
-        if lji == len(jls):
-            lji = 0
-            if gems_count:
-                hi += 1
-        if not gems_count:
-            hi += 1
-        if hi == len(head):
-            hi = 0
-            ci += 1
-        if ci == len(chest):
-            ci = 0
-            ai += 1
-        if ai == len(arms):
-            ai = 0
-            wi += 1
-        if wi == len(waist):
-            wi = 0
-            li += 1
-        if li == len(legs) or size_limit is not None and size_limit < index:
-            break
-        index += 1
-        if (index+1) % 100000 == 0:
-            time.sleep(1)
-    raise StopIteration
+            print('Search failed: {}'.format(job.error))
+            self.result_area.add_search_string('Search failed: {}'.format(
+                                               job.error))
+        return None
 
 
 def main():
@@ -1317,36 +1232,20 @@ def main():
     return None
 
 
-def piece_sort(piece):
-    item = armour[piece]
-    return (str(not bool('Torso Up' in item['skills'])) +
-           str(-int(item['rarity'])) + piece)
+game = core.default_game()
 
 
-with open('use_game.txt') as f:
-    game = f.read().strip()
+# Opens all the files and load in the data once.
+data = core.load_game(game)
+armour, jewels, skills = data.armour, data.jewels, data.skills
 
 
-# Opens all the files and load in the data once.
-with open('data/{}/armour.json'.format(game), 'r') as fp:
-    armour = json.loads(fp.read())
-with open('data/{}/jewels.json'.format(game), 'r') as fp:
-    jewels = json.loads(fp.read())
-with open('data/{}/skills.json'.format(game), 'r') as fp:
-    skills = json.loads(fp.read())
-
-
-# Parse through all the armour pieces and sort them to their part.
-head_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                    == 'Head'}, key=piece_sort)
-arm_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                    == 'Arms'}, key=piece_sort)
-chest_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                    == 'Chest'}, key=piece_sort)
-leg_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                    == 'Legs'}, key=piece_sort)
-waist_parts = sorted({x: armour[x] for x in armour if armour[x]['part']
-                    == 'Waist'}, key=piece_sort)
+# The pieces of each part were sorted when the game was compiled.
+head_parts = data.part_lists['Head']
+arm_parts = data.part_lists['Arms']
+chest_parts = data.part_lists['Chest']
+leg_parts = data.part_lists['Legs']
+waist_parts = data.part_lists['Waist']
 
 
 print('Loaded {} armour pieces in total.'.format(len(armour)))